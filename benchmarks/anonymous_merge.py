@@ -0,0 +1,95 @@
+"""
+Regression benchmark for merging anonymous declarations with their typedefs.
+
+Simulates the records produced for headers made of many `typedef enum {...} name;`
+declarations (libclang versions that report the enum with an empty spelling), and
+times the merge against the previous all-pairs implementation. Exits non-zero if the
+merge time grows faster than linearly with the number of declarations.
+
+Usage: python benchmarks/anonymous_merge.py [--sizes 1000 2000 4000 8000]
+"""
+
+import argparse
+import copy
+import sys
+import time
+
+from cheader2json.cheader_reader import CHeaderParser
+
+
+def makeRecords(count: int, headerFile: str = "synthetic.h") -> dict:
+    records = {}
+    for n in range(count):
+        line = n * 4 + 1
+        for kind, spelling in (("ENUM_DECL", ""), ("TYPEDEF_DECL", f"enum_{n}")):
+            records[len(records)] = {
+                "kind": kind,
+                "spelling": spelling,
+                "location": headerFile,
+                "start_line": line,
+                "end_line": line + 3,
+            }
+    return records
+
+
+def quadraticMerge(parsedInfo: dict) -> None:
+    deletekeys = []
+    for key in parsedInfo.keys():
+        if parsedInfo[key]["spelling"] == "":
+            for i in parsedInfo.keys():
+                if i != key:
+                    if (
+                        parsedInfo[key]["start_line"] == parsedInfo[i]["start_line"]
+                        and parsedInfo[key]["end_line"] == parsedInfo[i]["end_line"]
+                    ):
+                        parsedInfo[key]["spelling"] = parsedInfo[i]["spelling"]
+                        deletekeys.append(i)
+    for key in deletekeys:
+        del parsedInfo[key]
+
+
+def indexedMerge(parsedInfo: dict) -> None:
+    parser = CHeaderParser.__new__(CHeaderParser)
+    parser._mergeAnonymousDeclarations(parsedInfo)
+
+
+def timeMerge(merge, records: dict) -> float:
+    parsedInfo = copy.deepcopy(records)
+    start = time.perf_counter()
+    merge(parsedInfo)
+    elapsed = time.perf_counter() - start
+    assert all(v["spelling"] for v in parsedInfo.values())
+    return elapsed
+
+
+def main() -> int:
+    argParser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argParser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000])
+    argParser.add_argument(
+        "--max-growth",
+        type=float,
+        default=3.0,
+        help="Largest allowed ratio between the per-declaration time of the largest and smallest size",
+    )
+    args = argParser.parse_args()
+
+    perDecl = []
+    print(f"{'enums':>8} {'indexed (s)':>12} {'all-pairs (s)':>14}")
+    for size in args.sizes:
+        records = makeRecords(size)
+        indexed = timeMerge(indexedMerge, records)
+        quadratic = timeMerge(quadraticMerge, records)
+        perDecl.append(indexed / size)
+        print(f"{size:>8} {indexed:>12.4f} {quadratic:>14.4f}")
+
+    growth = perDecl[-1] / perDecl[0]
+    if growth > args.max_growth:
+        print(
+            f"Merge time per declaration grew by {growth:.1f}x, expected linear scaling"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+Benchmark of converting synthetic headers, to track conversion speed between commits.
+
+Generates C headers of growing size (functions with parameters, enums, nested structs,
+function pointer typedefs, macros and HELICS_DEPRECATED functions) and times each
+stage separately: CHeaderParser construction (libclang parse plus cursor walk, with
+the walk also reported on its own), writing the AST and types json, and diffAst
+between two versions of the header. The memory held by the parsed declarations, the
+peak memory of construction and the number of garbage collections it triggers are
+measured on a separate run, since tracing allocations slows conversion down. Results
+are written to a json file; pass the results of an earlier commit with --baseline to
+report the slowdown of each stage.
+
+Usage: python benchmarks/conversion.py [--sizes 100 200 400 800] [--output results.json]
+    [--baseline previous.json]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+from cheader2json.ast_writer import dumpTypes, openAstWriter
+from cheader2json.change_search import diffAst
+from cheader2json.cheader_reader import CHeaderParser
+
+STAGES = ["construct", "walk", "serialize", "diff"]
+
+
+def makeHeader(
+    functions: int,
+    parameters: int = 4,
+    enums: int = 0,
+    constants: int = 8,
+    structs: int = 0,
+    callbacks: int = 0,
+    macros: int = 0,
+    changed: bool = False,
+) -> str:
+    """
+    Generates the source of a synthetic C API header
+    @param functions: Number of functions, every tenth one is deprecated
+    @param parameters: Number of parameters of each function
+    @param enums: Number of enums, half of them anonymous enums named by a typedef
+    @param constants: Number of constants of each enum
+    @param structs: Number of structs, each containing a nested struct
+    @param callbacks: Number of function pointer typedefs
+    @param macros: Number of object-like macros
+    @param changed: Generate the next version of the header, with functions added,
+        removed and changed, for benchmarking diffs
+    """
+    lines = [
+        "#ifndef SYNTHETIC_H",
+        "#define SYNTHETIC_H",
+        "#define HELICS_EXPORT",
+        "#define HELICS_DEPRECATED __attribute__((deprecated))",
+        "typedef void* HelicsObject;",
+    ]
+    for n in range(macros):
+        lines.append(f"#define SYNTHETIC_MACRO_{n} {n}")
+    for n in range(enums):
+        values = ", ".join(f"SYNTHETIC_E{n}_C{c} = {c}" for c in range(constants))
+        if n % 2:
+            lines.append(f"typedef enum {{ {values} }} SyntheticEnum{n};")
+        else:
+            lines.append(f"enum SyntheticEnum{n} {{ {values} }};")
+    for n in range(structs):
+        lines.append(
+            f"typedef struct SyntheticStruct{n} {{ int id; const char* name; "
+            f"struct {{ double x; double y; }} position; }} SyntheticStruct{n};"
+        )
+    for n in range(callbacks):
+        lines.append(
+            f"typedef void (*SyntheticCallback{n})(int code, const char* message, void* data);"
+        )
+    types = ["int", "double", "const char*", "HelicsObject", "char**", "void*"]
+    for n in range(functions):
+        if changed and n % 7 == 0:
+            # Removed function
+            continue
+        args = ", ".join(
+            f"{types[(n + p) % len(types)]} arg{p}" for p in range(parameters)
+        )
+        result = "double" if changed and n % 5 == 0 else "int"
+        attributes = (
+            "HELICS_DEPRECATED HELICS_EXPORT" if n % 10 == 9 else "HELICS_EXPORT"
+        )
+        lines.append(f"/** Synthetic function {n} */")
+        lines.append(f"{attributes} {result} syntheticFunction{n}({args or 'void'});")
+    if changed:
+        for n in range(0, functions, 7):
+            lines.append(f"HELICS_EXPORT int syntheticAdded{n}(int value);")
+    lines.append("#endif")
+    return "\n".join(lines) + "\n"
+
+
+def convert(headerFile: str) -> tuple:
+    """
+    Converts a header, timing each stage
+    @return: The stage timings, and the AST as it is loaded back from the json file
+    """
+    start = time.perf_counter()
+    parser = CHeaderParser([headerFile], [])
+    construct = time.perf_counter() - start
+
+    astBuffer = io.StringIO()
+    typesBuffer = io.StringIO()
+    start = time.perf_counter()
+    with openAstWriter(astBuffer, "json", False) as writer:
+        for key, record in parser.parsedInfo.items():
+            writer.write(key, record)
+    dumpTypes(typesBuffer, parser.types, False)
+    serialize = time.perf_counter() - start
+
+    timings = {
+        "construct": construct,
+        "walk": parser.stats.phases["walk"],
+        "serialize": serialize,
+    }
+    return timings, json.loads(astBuffer.getvalue())
+
+
+def measureMemory(headerFile: str) -> dict:
+    """
+    Measures the memory used while converting a header
+    @return: The memory held by the parser once constructed and the peak memory of
+        construction in MiB, and the number of garbage collections of each generation
+        during construction
+    """
+    collections = [0, 0, 0]
+
+    def countCollection(phase: str, info: dict):
+        if phase == "start":
+            collections[info["generation"]] += 1
+
+    gc.collect()
+    gc.callbacks.append(countCollection)
+    tracemalloc.start()
+    try:
+        parser = CHeaderParser([headerFile], [])
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(countCollection)
+    del parser
+    return {
+        "retained_mib": retained / 2**20,
+        "peak_mib": peak / 2**20,
+        "gc_collections": collections,
+    }
+
+
+def runSize(tmpDir: str, size: int, repeat: int) -> dict:
+    shape = {
+        "functions": size,
+        "parameters": 4,
+        "enums": size // 10,
+        "constants": 8,
+        "structs": size // 20,
+        "callbacks": size // 20,
+        "macros": size // 10,
+    }
+    oldFile = os.path.join(tmpDir, f"synthetic_{size}.h")
+    newFile = os.path.join(tmpDir, f"synthetic_{size}_changed.h")
+    with open(oldFile, "w") as f:
+        f.write(makeHeader(**shape))
+    with open(newFile, "w") as f:
+        f.write(makeHeader(**shape, changed=True))
+
+    # Keep the fastest of each stage, the least disturbed by other load on the machine
+    best = {}
+    for _ in range(repeat):
+        timings, oldAst = convert(oldFile)
+        _, newAst = convert(newFile)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            diffAst(oldAst, newAst)
+        timings["diff"] = time.perf_counter() - start
+        for stage, seconds in timings.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+    return {
+        "size": size,
+        "shape": shape,
+        "declarations": len(oldAst),
+        "seconds": best,
+        "memory": measureMemory(oldFile),
+    }
+
+
+def _gitCommit() -> str:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            .stdout.decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _libclangVersion() -> str:
+    try:
+        return metadata.version("libclang")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict, maxSlowdown: float) -> int:
+    """
+    Prints the slowdown of each stage and size against a baseline
+    @return: The number of stages that slowed down by more than maxSlowdown
+    """
+    previous = {r["size"]: r["seconds"] for r in baseline["results"]}
+    regressions = 0
+    print(f"\nAgainst {baseline.get('commit', 'baseline')}:")
+    for result in results["results"]:
+        if result["size"] not in previous:
+            continue
+        ratios = []
+        for stage in STAGES:
+            ratio = result["seconds"][stage] / max(
+                previous[result["size"]][stage], 1e-9
+            )
+            if ratio > maxSlowdown:
+                regressions += 1
+            ratios.append(f"{ratio:>10.2f}x")
+        print(f"{result['size']:>8} " + " ".join(ratios))
+    return regressions
+
+
+def main() -> int:
+    argParser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argParser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 400, 800])
+    argParser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of runs of each size, the fastest time of each stage is kept",
+    )
+    argParser.add_argument(
+        "--output", default="benchmark_results.json", help="File to write results to"
+    )
+    argParser.add_argument("--baseline", help="Results of an earlier run to compare to")
+    argParser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="Largest allowed ratio between a stage time and its baseline time",
+    )
+    args = argParser.parse_args()
+
+    results = {
+        "commit": _gitCommit(),
+        "python": platform.python_version(),
+        "libclang": _libclangVersion(),
+        "results": [],
+    }
+    print(
+        f"{'size':>8} {'decls':>8} "
+        + " ".join(f"{s + ' (s)':>11}" for s in STAGES)
+        + f" {'held (MiB)':>11} {'peak (MiB)':>11} {'gc runs':>11}"
+    )
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in args.sizes:
+            result = runSize(tmpDir, size, args.repeat)
+            results["results"].append(result)
+            memory = result["memory"]
+            print(
+                f"{size:>8} {result['declarations']:>8} "
+                + " ".join(f"{result['seconds'][s]:>11.4f}" for s in STAGES)
+                + f" {memory['retained_mib']:>11.2f} {memory['peak_mib']:>11.2f}"
+                + f" {sum(memory['gc_collections']):>11}"
+            )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_slowdown):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
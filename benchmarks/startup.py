@@ -0,0 +1,215 @@
+"""
+Benchmark of the startup cost of the commands that don't parse headers.
+
+Runs each command (diff, diff --check, query, --help, and --version when the package is
+installed) in a fresh interpreter with `python -X importtime`, and checks that none of
+them imports clang or the parser. The overhead of each command is its total import
+time beyond that of running a module that imports click, pathlib and json, the least
+any command of the CLI can cost, and the wall time of each command is compared to that
+of an empty interpreter.
+
+Exits non-zero if a command imports a parsing module, or, when the results of an
+earlier run are given with --baseline (e.g. of the main branch on the same machine),
+if the overhead of a command grew by more than --max-regression milliseconds.
+
+Usage: python benchmarks/startup.py [--repeat 10] [--baseline startup_main.json]
+    [--max-regression 5] [--output startup_results.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+# Modules that only commands parsing headers may import
+PARSING_MODULES = [
+    "clang",
+    "clang.cindex",
+    "cheader2json.cheader_reader",
+    "cheader2json.cursor_filter",
+    "cheader2json.git_source",
+    "cheader2json.watch",
+    "concurrent.futures.process",
+]
+
+_RECORDS = {
+    "0": {
+        "kind": "FUNCTION_DECL",
+        "spelling": "startupFunction",
+        "location": "startup.h",
+        "type": "int (int)",
+        "result_type": "int",
+        "arguments": {
+            "0": {
+                "kind": "PARM_DECL",
+                "spelling": "value",
+                "location": "startup.h",
+                "type": "int",
+                "result_type": "",
+            }
+        },
+        "argument_count": 1,
+    }
+}
+
+
+def _importTime(args: list) -> tuple:
+    """
+    Runs a python command with -X importtime
+    @return: The total import time in seconds, and the names of the imported modules
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # Header line
+            continue
+        modules.add(name.strip())
+        # Top level imports have no indentation, their cumulative times add up to the total
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1e6, modules
+
+
+def _wallTime(args: list) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def measure(args: list, repeat: int) -> dict:
+    """
+    Measures the startup of a python command, keeping the fastest of several runs
+    """
+    importSeconds = []
+    modules = set()
+    wallSeconds = []
+    for _ in range(repeat):
+        seconds, modules = _importTime(args)
+        importSeconds.append(seconds)
+        wallSeconds.append(_wallTime(args))
+    return {
+        "import_seconds": min(importSeconds),
+        "wall_seconds": min(wallSeconds),
+        "modules": modules,
+    }
+
+
+def _commands(tmpDir: str) -> dict:
+    astFile = os.path.join(tmpDir, "startup.ast.json")
+    with open(astFile, "w") as f:
+        json.dump(_RECORDS, f)
+    commands = {
+        "diff": ["diff", astFile, astFile],
+        "diff --check": ["diff", "--check", astFile, astFile],
+        "query": ["query", "--kind", "FUNCTION_DECL", astFile],
+        "--help": ["--help"],
+    }
+    try:
+        metadata.version("cheader2json")
+        commands["--version"] = ["--version"]
+    except metadata.PackageNotFoundError:
+        # click can only report the version of an installed package
+        pass
+    return {name: ["-m", "cheader2json"] + args for name, args in commands.items()}
+
+
+def main() -> int:
+    argParser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argParser.add_argument(
+        "--repeat",
+        type=int,
+        default=10,
+        help="Number of runs of each command, the fastest time is kept",
+    )
+    argParser.add_argument(
+        "--baseline",
+        help="Results file of an earlier run to compare the overhead of each command to",
+    )
+    argParser.add_argument(
+        "--max-regression",
+        type=float,
+        default=5.0,
+        help="Largest allowed growth of the overhead of a command over the baseline, in milliseconds",
+    )
+    argParser.add_argument(
+        "--output", default="startup_results.json", help="File to write results to"
+    )
+    args = argParser.parse_args()
+
+    previous = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = json.load(f)["commands"]
+
+    python = measure(["-c", "pass"], args.repeat)
+    # Every command is run as a module and imports pathlib for the path options of click
+    baseline = measure(["-c", "import runpy, pathlib, click, json"], args.repeat)
+    print(
+        f"{'command':>14} {'import (ms)':>12} {'overhead (ms)':>14} {'wall (ms)':>10}"
+        f" {'baseline overhead (ms)':>23}"
+    )
+    print(
+        f"{'python':>14} {python['import_seconds'] * 1000:>12.1f} {'':>14}"
+        f" {python['wall_seconds'] * 1000:>10.1f}"
+    )
+    print(
+        f"{'baseline':>14} {baseline['import_seconds'] * 1000:>12.1f} {'':>14}"
+        f" {baseline['wall_seconds'] * 1000:>10.1f}"
+    )
+
+    results = {"python": python, "baseline": baseline, "commands": {}}
+    failures = []
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for name, command in _commands(tmpDir).items():
+            result = measure(command, args.repeat)
+            overhead = result["import_seconds"] - baseline["import_seconds"]
+            result["overhead_seconds"] = overhead
+            results["commands"][name] = result
+            previousOverhead = previous.get(name, {}).get("overhead_seconds")
+            print(
+                f"{name:>14} {result['import_seconds'] * 1000:>12.1f}"
+                f" {overhead * 1000:>14.1f} {result['wall_seconds'] * 1000:>10.1f}"
+                + (
+                    f" {previousOverhead * 1000:>23.1f}"
+                    if previousOverhead is not None
+                    else ""
+                )
+            )
+            parsing = sorted(set(PARSING_MODULES) & result["modules"])
+            if parsing:
+                failures.append(f"{name} imports {', '.join(parsing)}")
+            if (
+                previousOverhead is not None
+                and (overhead - previousOverhead) * 1000 > args.max_regression
+            ):
+                failures.append(
+                    f"{name} takes {(overhead - previousOverhead) * 1000:.1f} ms longer"
+                    " to import than in the baseline"
+                )
+
+    for result in [python, baseline] + list(results["commands"].values()):
+        result["modules"] = sorted(result["modules"])
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
 import json
+import os
 import pathlib
+import re
+import sys
 from typing import Optional
 
 import click
 
-from cheader2json.change_search import diffAst
-from cheader2json.cheader_reader import CHeaderParser
+# Only the choices of the options are imported here, from a module without imports, so
+# the CLI starts without loading libclang or the readers and writers of the ast files.
+# Commands import what they use when invoked.
+from cheader2json.constants import AST_FORMATS, OPTIONAL_FIELDS, SCHEMAS
 
 
 @click.group(invoke_without_command=True)
@@ -29,6 +34,118 @@ def cli(ctx):
     multiple=True,
     help="Macro to ignore. Can be given multiple times (if using an envvar the names are split on spaces).",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes used to parse the header files.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Directory used to cache parse results, headers that have not changed since a previous run are loaded from it instead of being parsed.",
+)
+@click.option(
+    "--preamble",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    help="Header included by every header file, precompiled once and reused when parsing the others. Can be given multiple times.",
+)
+@click.option(
+    "--pch-dir",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Directory to store the precompiled preamble in, so later runs can reuse it.",
+)
+@click.option(
+    "--umbrella",
+    is_flag=True,
+    help="Parse all header files as a single translation unit that includes each of them, so headers included by other header files are only parsed once.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(AST_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the ast file, ndjson writes one top level declaration per line to a .ast.ndjson file, bin writes an indexed binary .ast.bin file.",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Write the json files without indentation.",
+)
+@click.option(
+    "--schema",
+    type=click.Choice(SCHEMAS),
+    default="v1",
+    show_default=True,
+    help="Schema of the json files, v2 stores children as arrays and file paths once in a table, and only supports --format=json.",
+)
+@click.option(
+    "--sort",
+    is_flag=True,
+    help="Sort the declarations of a --format=ndjson ast file by kind and name, as needed by `diff --stream`.",
+)
+@click.option(
+    "--deprecation-macro",
+    multiple=True,
+    default=["HELICS_DEPRECATED"],
+    show_default=True,
+    help="Attribute macro that marks a function as deprecated. Can be given multiple times.",
+)
+@click.option(
+    "--annotation-macro",
+    multiple=True,
+    help="Other attribute macro to record in the annotations of functions it is used on. Can be given multiple times.",
+)
+@click.option(
+    "--include-kind",
+    multiple=True,
+    help="Only convert top level declarations of this cursor kind, e.g. FUNCTION_DECL. Can be given multiple times.",
+)
+@click.option(
+    "--exclude-kind",
+    multiple=True,
+    help="Skip top level declarations of this cursor kind. Can be given multiple times.",
+)
+@click.option(
+    "--include-name",
+    multiple=True,
+    help="Only convert top level declarations with a name matching this regular expression. Can be given multiple times.",
+)
+@click.option(
+    "--exclude-name",
+    multiple=True,
+    help="Skip top level declarations with a name matching this regular expression. Can be given multiple times.",
+)
+@click.option(
+    "--omit-field",
+    multiple=True,
+    type=click.Choice(OPTIONAL_FIELDS),
+    help="Leave out comments, values read from tokens (of variables and macros) or line ranges. Without line ranges anonymous declarations are not named after their typedef and functions are not annotated. Can be given multiple times.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and rewrite the output files whenever a header file (or a file it includes) changes, only reparsing the changed header files. --jobs, --cache-dir, --preamble and --umbrella are not used in this mode.",
+)
+@click.option(
+    "--server",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Unix socket of a `cheader2json serve` process to send the conversion to, instead of parsing in this process.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write per phase and per header timings, cursor kind counts and clang diagnostics counts to this json file.",
+)
+@click.option(
+    "--log-file",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write debug logging of the parser to this file.",
+)
 # Potentially useful to also support reading from stdin by passing `-` as filename?
 @click.argument(
     "header",
@@ -37,7 +154,29 @@ def cli(ctx):
     type=click.Path(exists=True, path_type=pathlib.Path),
 )
 def convert(
-    header: tuple[pathlib.Path], prefix: Optional[str], ignore_macro: tuple[str]
+    header: tuple[pathlib.Path],
+    prefix: Optional[str],
+    ignore_macro: tuple[str],
+    jobs: int,
+    cache_dir: Optional[pathlib.Path],
+    preamble: tuple[pathlib.Path],
+    pch_dir: Optional[pathlib.Path],
+    umbrella: bool,
+    output_format: str,
+    compact: bool,
+    schema: str,
+    sort: bool,
+    deprecation_macro: tuple[str],
+    annotation_macro: tuple[str],
+    include_kind: tuple[str],
+    exclude_kind: tuple[str],
+    include_name: tuple[str],
+    exclude_name: tuple[str],
+    omit_field: tuple[str],
+    watch: bool,
+    server: Optional[pathlib.Path],
+    profile: Optional[pathlib.Path],
+    log_file: Optional[pathlib.Path],
 ):
     """Convert the given C headers to json files with ast and type information."""
     if not header:
@@ -46,20 +185,434 @@ def convert(
     if not prefix:
         # No prefix for output files given, derive from stem of the first header file given
         prefix = header[0].stem
-    parser = CHeaderParser([str(h) for h in header], list(ignore_macro))
-    with open(f"{prefix}.ast.json", "w+") as f:
-        json.dump(parser.parsedInfo, f, indent=4, sort_keys=False)
+    from cheader2json.cursor_filter import CursorFilter
 
-    with open(f"{prefix}.types.json", "w+") as f:
-        json.dump(parser._types, f, indent=4, sort_keys=False)
+    try:
+        cursorFilter = CursorFilter(
+            include_kind,
+            exclude_kind,
+            include_name,
+            exclude_name,
+            omit_field,
+        )
+    except (ValueError, re.error) as e:
+        raise click.BadParameter(str(e)) from e
+    if schema == "v2" and (output_format != "json" or watch or server):
+        raise click.UsageError(
+            "--schema=v2 is only supported with --format=json, without --watch or --server."
+        )
+    if sort and (output_format != "ndjson" or watch or server):
+        raise click.UsageError(
+            "--sort is only supported with --format=ndjson, without --watch or --server."
+        )
+    if server:
+        from cheader2json.watch import requestConversion
+
+        response = requestConversion(
+            str(server),
+            {
+                "cwd": os.getcwd(),
+                "headers": [str(h) for h in header],
+                "prefix": prefix,
+                "ignore_macros": list(ignore_macro),
+                "deprecation_macros": list(deprecation_macro),
+                "annotation_macros": list(annotation_macro),
+                "format": output_format,
+                "compact": compact,
+                "include_kinds": list(include_kind),
+                "exclude_kinds": list(exclude_kind),
+                "include_names": list(include_name),
+                "exclude_names": list(exclude_name),
+                "omit_fields": list(omit_field),
+            },
+        )
+        if response["status"] != "ok":
+            raise click.ClickException(response["message"])
+        return
+    if watch:
+        from cheader2json.watch import IncrementalConverter
+        from cheader2json.watch import watch as watchHeaders
+
+        converter = IncrementalConverter(
+            [str(h) for h in header],
+            list(ignore_macro),
+            list(deprecation_macro),
+            list(annotation_macro),
+            cursorFilter,
+        )
+        try:
+            watchHeaders(converter, prefix, output_format, compact)
+        except KeyboardInterrupt:
+            pass
+        return
+    from cheader2json.ast_writer import writeConversion
+    from cheader2json.cheader_reader import CHeaderParser
+
+    parser = CHeaderParser(
+        [str(h) for h in header],
+        list(ignore_macro),
+        jobs,
+        str(cache_dir) if cache_dir else None,
+        [str(p) for p in preamble],
+        str(pch_dir) if pch_dir else None,
+        umbrella,
+        parse=False,
+        deprecationMacros=list(deprecation_macro),
+        annotationMacros=list(annotation_macro),
+        logFile=str(log_file) if log_file else None,
+        cursorFilter=cursorFilter,
+    )
+    writeConversion(
+        parser, list(ignore_macro), prefix, output_format, compact, schema, sort
+    )
+
+    if profile:
+        with open(profile, "w") as f:
+            json.dump(parser.stats.toDict(), f, indent=4)
 
 
 @cli.command()
+@click.option(
+    "--workers",
+    "-j",
+    type=click.IntRange(min=1),
+    help="Number of worker processes running jobs, overrides the manifest. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--max-memory",
+    type=click.IntRange(min=1),
+    metavar="MIB",
+    help="Limit on the memory (address space) of each worker process in MiB, overrides the manifest. Not supported on Windows.",
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write the status, timings and errors of each job to this json file.",
+)
+@click.argument(
+    "manifest", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path)
+)
+def batch(
+    manifest: pathlib.Path,
+    workers: Optional[int],
+    max_memory: Optional[int],
+    report: Optional[pathlib.Path],
+):
+    """Convert the sets of C headers listed in a TOML manifest on a pool of worker processes. Exits with status 1 if any job failed."""
+    from cheader2json.batch import ManifestError, loadManifest, runBatch
+
+    try:
+        loaded = loadManifest(str(manifest))
+    except ManifestError as e:
+        raise click.ClickException(str(e)) from e
+
+    def printResult(result):
+        line = f"{result.status:6} {result.seconds:8.2f}s  {result.prefix}"
+        if result.error:
+            line += f": {result.error}"
+        click.echo(line)
+
+    results = runBatch(
+        loaded.jobs,
+        workers or loaded.workers,
+        max_memory or loaded.maxMemory,
+        printResult,
+    )
+    failed = sum(1 for r in results if r.status != "ok")
+    click.echo(f"{len(results) - failed} of {len(results)} jobs succeeded")
+    if report:
+        with open(report, "w") as f:
+            json.dump([r._asdict() for r in results], f, indent=4)
+    if failed:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Print the changes as human-readable text or as a json list of change records.",
+)
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Only check for API changes, print the first change found and exit with status 1, or exit with status 0 if there are none. Files with the same fingerprint (written by convert next to the ast file) are not read.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Compare two ast files written with `convert --format=ndjson --sort` one declaration at a time, printing changes as they are found in declaration order.",
+)
 @click.argument("oldast", type=click.File("rb"))
 @click.argument("newast", type=click.File("rb"))
-def diff(oldast, newast):
-    """Compare two AST JSON files and print a human-readable set of changes that occurred in the header files."""
-    diffAst(json.load(oldast), json.load(newast))
+def diff(oldast, newast, output_format: str, check: bool, stream: bool):
+    """Compare two AST JSON (or ndjson, or binary AST) files and print a human-readable set of changes that occurred in the header files."""
+    if check:
+        from cheader2json.fingerprint import readAstFingerprint
+
+        # Files converted with the same fingerprint have no changes, don't load them
+        oldFingerprint = readAstFingerprint(oldast)
+        if oldFingerprint is not None and oldFingerprint == readAstFingerprint(newast):
+            return
+    from cheader2json.change_search import SortedAstError, formatChange
+
+    if stream:
+        from cheader2json.change_search import iterSortedChanges, readSortedNdjson
+
+        changes = iterSortedChanges(
+            readSortedNdjson(oldast, oldast.name), readSortedNdjson(newast, newast.name)
+        )
+    else:
+        from cheader2json.ast_index import AstIndex, loadAst
+        from cheader2json.change_search import firstChange, iterChanges
+
+        oldIndex = AstIndex(loadAst(oldast))
+        newIndex = AstIndex(loadAst(newast))
+        changes = iterChanges(oldIndex, newIndex)
+    try:
+        if check:
+            if stream:
+                change = next((c for c in changes if c.change != "unknown"), None)
+            else:
+                change = firstChange(oldIndex, newIndex)
+            if change is None:
+                return
+            if output_format == "json":
+                click.echo(json.dumps(change._asdict(), indent=4))
+            else:
+                click.echo(formatChange(change))
+            sys.exit(1)
+        if output_format == "json":
+            # Written one change at a time, the same as json.dumps of the list of changes
+            count = 0
+            for change in changes:
+                value = json.dumps(change._asdict(), indent=4).replace("\n", "\n    ")
+                click.echo(("," if count else "[") + "\n    " + value, nl=False)
+                count += 1
+            click.echo("\n]" if count else "[]")
+        else:
+            for change in changes:
+                click.echo(formatChange(change))
+    except SortedAstError as e:
+        raise click.ClickException(str(e)) from e
+
+
+@cli.command()
+@click.option("--name", help="Declarations with this name.")
+@click.option("--kind", help="Declarations of this cursor kind, e.g. FUNCTION_DECL.")
+@click.option(
+    "--file",
+    "location",
+    help="Declarations in this header file, as spelled in the AST.",
+)
+@click.option(
+    "--users-of",
+    metavar="TYPE",
+    help="Functions returning or taking this type, e.g. HelicsFederate.",
+)
+@click.option("--constants-of", metavar="ENUM", help="Constants of this enum.")
+@click.option("--enum-of", metavar="CONSTANT", help="The enum this constant is in.")
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Print one line per declaration, or the full records as a json list.",
+)
+@click.argument("ast", type=click.File("rb"))
+def query(
+    ast,
+    name: Optional[str],
+    kind: Optional[str],
+    location: Optional[str],
+    users_of: Optional[str],
+    constants_of: Optional[str],
+    enum_of: Optional[str],
+    output_format: str,
+):
+    """Look up declarations in an AST JSON (or binary AST) file. When several options are given, only declarations matching all of them are printed."""
+    from cheader2json.ast_index import AstIndex, loadAst
+
+    index = AstIndex(loadAst(ast))
+    selections = []
+    if name is not None:
+        selections.append(index.lookup(name))
+    if kind is not None:
+        selections.append(index.findAll(kind))
+    if location is not None:
+        selections.append(index.inFile(location))
+    if users_of is not None:
+        selections.append(
+            [
+                f
+                for user in index.usersOf(users_of)
+                for f in index.lookup(user, "FUNCTION_DECL")
+            ]
+        )
+    if constants_of is not None:
+        selections.append(index.constantsOf(constants_of))
+    if enum_of is not None:
+        enum = index.enumOf(enum_of)
+        selections.append(index.lookup(enum, "ENUM_DECL") if enum is not None else [])
+    if not selections:
+        raise click.UsageError("Give at least one of the query options.")
+    # Keep the declarations selected by every option, in the order of the first
+    selected = selections[0]
+    for other in selections[1:]:
+        ids = {id(record) for record in other}
+        selected = [record for record in selected if id(record) in ids]
+    if output_format == "json":
+        # Records of binary ASTs are only decoded here, once they have been selected
+        click.echo(json.dumps(selected, indent=4, default=dict))
+    else:
+        for record in selected:
+            click.echo(
+                f"{record['kind']} {record['spelling']} {record['location']}:{record.get('start_line', '')}"
+            )
+
+
+@cli.command()
+@click.option(
+    "--workers",
+    "-j",
+    type=click.IntRange(min=1),
+    help="Number of worker processes computing the diffs between versions. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Print the diffs and timeline as human-readable text or as json.",
+)
+@click.argument(
+    "asts",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+def history(asts: tuple[pathlib.Path], workers: Optional[int], output_format: str):
+    """Print the changes between each consecutive pair of AST JSON (or ndjson, or binary AST) files, oldest first, and a timeline of when each symbol was added, changed, deprecated or removed.
+
+    Each file is loaded once and the diffs are computed on a pool of worker processes."""
+    from cheader2json.change_search import formatChange
+    from cheader2json.history import apiHistory, formatEvent
+
+    if len(asts) < 2:
+        raise click.UsageError("Give at least two ast files.")
+    result = apiHistory([str(a) for a in asts], workers)
+    if output_format == "json":
+        data = {
+            "versions": result.versions,
+            "diffs": [
+                {
+                    "old": old,
+                    "new": new,
+                    "changes": [change._asdict() for change in changes],
+                }
+                for old, new, changes in zip(
+                    result.versions, result.versions[1:], result.diffs
+                )
+            ],
+            "timeline": [
+                {
+                    "kind": kind,
+                    "path": path,
+                    "events": [event._asdict() for event in events],
+                }
+                for (kind, path), events in result.timeline.items()
+            ],
+        }
+        click.echo(json.dumps(data, indent=4))
+        return
+    for old, new, changes in zip(result.versions, result.versions[1:], result.diffs):
+        click.echo(f"{old} -> {new}")
+        for change in changes:
+            click.echo(f"    {formatChange(change)}")
+    click.echo("")
+    click.echo("Timeline")
+    for (kind, path), events in result.timeline.items():
+        click.echo(f"{kind} {'.'.join(path)}")
+        for event in events:
+            click.echo(f"    {formatEvent(event)}")
+
+
+@cli.command("compare-revs")
+@click.option(
+    "--ignore-macro",
+    "-i",
+    envvar="IGNORED_MACROS",
+    multiple=True,
+    help="Macro to ignore. Can be given multiple times (if using an envvar the names are split on spaces).",
+)
+@click.option(
+    "--deprecation-macro",
+    multiple=True,
+    default=["HELICS_DEPRECATED"],
+    show_default=True,
+    help="Attribute macro that marks a function as deprecated. Can be given multiple times.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Print the changes as human-readable text or as a json list of change records.",
+)
+@click.argument(
+    "repo", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path)
+)
+@click.argument("old_rev")
+@click.argument("new_rev")
+@click.argument("header_paths", nargs=-1, required=True)
+def compare_revs(
+    repo: pathlib.Path,
+    old_rev: str,
+    new_rev: str,
+    header_paths: tuple[str],
+    ignore_macro: tuple[str],
+    deprecation_macro: tuple[str],
+    output_format: str,
+):
+    """Convert the headers of two git revisions straight from the object store, without checking them out, and print the changes between them.
+
+    HEADER_PATHS are paths or glob patterns relative to the root of the repository."""
+    from cheader2json.change_search import diffAst, iterChanges
+    from cheader2json.git_source import GitSourceError, convertRevisions
+
+    try:
+        old_ast, new_ast = convertRevisions(
+            str(repo),
+            [old_rev, new_rev],
+            list(header_paths),
+            list(ignore_macro),
+            list(deprecation_macro),
+        )
+    except GitSourceError as e:
+        raise click.ClickException(str(e)) from e
+    if output_format == "json":
+        changes = [change._asdict() for change in iterChanges(old_ast, new_ast)]
+        click.echo(json.dumps(changes, indent=4))
+    else:
+        diffAst(old_ast, new_ast)
+
+
+@cli.command()
+@click.argument("socket_path", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+def serve(socket_path: pathlib.Path):
+    """Serve conversion requests from `convert --server` on a Unix socket, keeping parsed headers in memory so only changed header files are reparsed."""
+    from cheader2json.watch import serve as serveConversions
+
+    try:
+        serveConversions(str(socket_path))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
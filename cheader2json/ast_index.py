@@ -0,0 +1,225 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import json
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional
+
+from cheader2json.binary_ast import BinaryAst
+from cheader2json.fingerprint import astFingerprint
+from cheader2json.schema_v2 import AstV2, childRecords, isAstV2
+
+# Values of type fields that are placeholders rather than type names
+_NOT_TYPE_NAMES = {None, "", "Invalid", "Double Pointer"}
+
+# Fields of functions and parameters naming the types they use
+_TYPE_FIELDS = (
+    "result_type",
+    "type",
+    "pointer_type",
+    "double_pointer_type",
+    "pointer_underlying_type",
+)
+
+
+def loadAst(f):
+    """
+    Loads an AST file of either schema, or an ndjson AST file keyed by position. Binary
+    AST files are memory-mapped instead of read in full
+    @param f: A buffered binary file object
+    """
+    if BinaryAst.isBinaryAst(f):
+        return BinaryAst(f)
+    text = f.read()
+    if not text.strip():
+        # An ndjson AST of a header file without declarations
+        return {}
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        if e.msg != "Extra data":
+            raise
+        data = None
+    if data is None or "kind" in data:
+        # One record per line, top level records of an AST never have a kind key
+        lines = (line for line in text.splitlines() if line.strip())
+        return {str(i): json.loads(line) for i, line in enumerate(lines)}
+    if isAstV2(data):
+        return AstV2(data)
+    return data
+
+
+class AstIndex(Mapping):
+    """
+    In-memory index over the top level declarations of a converted AST
+
+    Built in a single pass, after which lookups by name, kind, file, type (the functions
+    using it) and enum (its constants, and the enum of a constant) are dictionary
+    lookups. It is a mapping with the same keys and records as the AST it indexes, so
+    it can be used anywhere an AST can, and building it once lets diffs and generators
+    share it. The type and enum lookups are indexed when first used.
+
+    Records of a binary AST are LazyRecords, which are only decoded when a field that
+    is not in its declaration table (kind, spelling, location, lines, fingerprint and
+    deprecated) is accessed, so declarations a diff skips are never decoded.
+
+    @ivar fingerprint: The fingerprint of the whole AST, None if it was converted
+        without declaration fingerprints
+    """
+
+    def __init__(self, ast: Mapping):
+        """
+        Constructor
+        @param ast: A loaded AST json file, binary AST or parsedInfo dictionary
+        """
+        self._records = {}
+        self._byKind: Dict[str, List[dict]] = {}
+        self._byName: Dict[str, List[dict]] = {}
+        self._byFile: Dict[str, List[dict]] = {}
+        self._declarations: Dict[str, Dict[str, dict]] = {}
+        self._typeUsers: Optional[Dict[str, Dict[str, None]]] = None
+        self._enumConstants: Optional[Dict[str, List[dict]]] = None
+        self._constantEnums: Dict[str, str] = {}
+        self.deprecated: Dict[str, bool] = {}
+        deprecatedLines = set()
+        functionLines = {}
+        items = ast.lazyItems() if isinstance(ast, BinaryAst) else ast.items()
+        for key, record in items:
+            self._records[key] = record
+            kind, spelling = record["kind"], record["spelling"]
+            self._byKind.setdefault(kind, []).append(record)
+            self._byName.setdefault(spelling, []).append(record)
+            self._byFile.setdefault(record["location"], []).append(record)
+            self._declarations.setdefault(kind, {})[spelling] = record
+            if kind == "FUNCTION_DECL":
+                if "deprecated" in record:
+                    if record["deprecated"]:
+                        self.deprecated[spelling] = True
+                elif "start_line" in record:
+                    line = (record["location"], record["start_line"])
+                    functionLines.setdefault(line, []).append(spelling)
+            elif (
+                kind == "MACRO_INSTANTIATION"
+                and spelling == "HELICS_DEPRECATED"
+                and "start_line" in record
+            ):
+                deprecatedLines.add((record["location"], record["start_line"]))
+        self.fingerprint = astFingerprint(self._records.values())
+        # ASTs converted before functions had a deprecated field, match deprecation macros by
+        # line. ASTs converted without line ranges have neither, so nothing is deprecated.
+        for line in deprecatedLines:
+            for f in functionLines.get(line, []):
+                self.deprecated[f] = True
+
+    @classmethod
+    def load(cls, path: str) -> "AstIndex":
+        """
+        Loads and indexes an AST json or binary AST file
+        """
+        with open(path, "rb") as f:
+            return cls(loadAst(f))
+
+    def _indexTypeUsers(self) -> Dict[str, Dict[str, None]]:
+        if self._typeUsers is None:
+            self._typeUsers = {}
+            for function in self._byKind.get("FUNCTION_DECL", []):
+                name = function["spelling"]
+                arguments = list(childRecords(function.get("arguments", {})))
+                for record in [function] + arguments:
+                    for field in _TYPE_FIELDS:
+                        typeName = record.get(field)
+                        if typeName not in _NOT_TYPE_NAMES:
+                            self._typeUsers.setdefault(typeName, {})[name] = None
+        return self._typeUsers
+
+    def _indexEnums(self) -> Dict[str, List[dict]]:
+        if self._enumConstants is None:
+            self._enumConstants = {}
+            for enum in self._byKind.get("ENUM_DECL", []):
+                constants = list(childRecords(enum.get("enumerations", {})))
+                self._enumConstants[enum["spelling"]] = constants
+                for constant in constants:
+                    self._constantEnums[constant["spelling"]] = enum["spelling"]
+        return self._enumConstants
+
+    def findAll(self, kind: str) -> List[dict]:
+        """
+        Gets all top level records of a kind, in AST order
+        @param kind: The cursor kind name, e.g. FUNCTION_DECL
+        """
+        return list(self._byKind.get(kind, []))
+
+    def lookup(self, spelling: str, kind: Optional[str] = None) -> List[dict]:
+        """
+        Gets the top level records with a spelling, in AST order
+        @param spelling: The name of the declaration
+        @param kind: The cursor kind name, any kind if not given
+        """
+        return [
+            r
+            for r in self._byName.get(spelling, [])
+            if kind is None or r["kind"] == kind
+        ]
+
+    def declaration(self, kind: str, spelling: str) -> Optional[dict]:
+        """
+        Gets the last top level record of a kind with a spelling, the one diffs compare
+        """
+        return self._declarations.get(kind, {}).get(spelling)
+
+    def declarations(self, kind: str) -> Dict[str, dict]:
+        """
+        Gets the last top level record of a kind for each spelling
+        """
+        return self._declarations.get(kind, {})
+
+    def inFile(self, location: str) -> List[dict]:
+        """
+        Gets the top level records declared in a header file, in AST order
+        """
+        return list(self._byFile.get(location, []))
+
+    def usersOf(self, typeName: str) -> List[str]:
+        """
+        Gets the names of the functions returning or taking a type, directly or through
+        pointers
+        @param typeName: A type name as it appears in the AST, e.g. HelicsFederate,
+            Int or HelicsFederate_*
+        """
+        return list(self._indexTypeUsers().get(typeName, {}))
+
+    def constantsOf(self, enum: str) -> List[dict]:
+        """
+        Gets the constants of an enum, in declaration order
+        """
+        return list(self._indexEnums().get(enum, []))
+
+    def enumOf(self, constant: str) -> Optional[str]:
+        """
+        Gets the name of the enum a constant belongs to
+        """
+        self._indexEnums()
+        return self._constantEnums.get(constant)
+
+    def kinds(self) -> List[str]:
+        return list(self._byKind)
+
+    def files(self) -> List[str]:
+        return list(self._byFile)
+
+    def types(self) -> List[str]:
+        return list(self._indexTypeUsers())
+
+    def __getitem__(self, key) -> dict:
+        return self._records[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,195 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import json
+from operator import itemgetter
+from typing import IO, List, Tuple
+
+from cheader2json.binary_ast import BinaryAstWriter
+from cheader2json.declarations import asDict
+from cheader2json.fingerprint import combineFingerprints, writeAstFingerprint
+from cheader2json.schema_v2 import JsonAstV2Writer, dumpTypesV2
+
+
+def sortKey(record: dict) -> Tuple[str, str]:
+    """
+    Gets the key records of sorted ndjson files are sorted by, for streaming diffs
+    """
+    return record["kind"], record["spelling"]
+
+
+class JsonAstWriter(object):
+    """
+    Writes top level AST records to a JSON object one record at a time
+
+    The output is identical to calling json.dump on a dict with all of the records,
+    without ever holding more than one record in memory.
+    """
+
+    def __init__(self, f: IO[str], compact: bool = False):
+        self.f = f
+        self.compact = compact
+        self._count = 0
+        self.f.write("{")
+
+    def write(self, key, record: dict):
+        """
+        Writes a single top level record
+        @param key: The parsedInfo key of the record
+        @param record: The cursor info record
+        """
+        separator = "," if self._count else ""
+        if self.compact:
+            self.f.write(
+                f"{separator}{json.dumps(str(key))}:"
+                f"{json.dumps(record, separators=(',', ':'), default=asDict)}"
+            )
+        else:
+            value = json.dumps(record, indent=4, default=asDict).replace("\n", "\n    ")
+            self.f.write(f"{separator}\n    {json.dumps(str(key))}: {value}")
+        self._count += 1
+
+    def close(self):
+        """
+        Terminates the JSON object
+        """
+        if self._count and not self.compact:
+            self.f.write("\n")
+        self.f.write("}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NdjsonAstWriter(object):
+    """
+    Writes top level AST records as newline-delimited JSON, one record per line
+
+    Sorted output (for streaming diffs) is written when the writer is closed, holding
+    the serialized lines until then instead of the records.
+    """
+
+    def __init__(self, f: IO[str], sort: bool = False):
+        self.f = f
+        self._lines = [] if sort else None
+
+    def write(self, key, record: dict):
+        """
+        Writes a single top level record
+        @param key: The parsedInfo key of the record (not included in the output)
+        @param record: The cursor info record
+        """
+        line = json.dumps(record, separators=(",", ":"), default=asDict)
+        if self._lines is not None:
+            self._lines.append((sortKey(record), line))
+            return
+        self.f.write(line)
+        self.f.write("\n")
+
+    def close(self):
+        """
+        Writes the sorted records, records with the same sort key stay in AST order
+        """
+        if self._lines is None:
+            return
+        self._lines.sort(key=itemgetter(0))
+        for _, line in self._lines:
+            self.f.write(line)
+            self.f.write("\n")
+        self._lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def openAstWriter(
+    f: IO,
+    outputFormat: str,
+    compact: bool = False,
+    schema: str = "v1",
+    sort: bool = False,
+):
+    """
+    Creates the writer for an ast file format
+    @param f: The file to write to, opened in binary mode for the bin format
+    @param outputFormat: One of AST_FORMATS
+    @param compact: Write json without indentation
+    @param schema: One of SCHEMAS, v2 is only supported by the json format
+    @param sort: Sort the records by kind and spelling, only supported by the ndjson
+        format
+    """
+    if sort and outputFormat != "ndjson":
+        raise ValueError(f"Sorting is not supported by the {outputFormat} format")
+    if schema == "v2":
+        if outputFormat != "json":
+            raise ValueError(f"Schema v2 is not supported by the {outputFormat} format")
+        return JsonAstV2Writer(f, compact)
+    if outputFormat == "bin":
+        return BinaryAstWriter(f)
+    if outputFormat == "ndjson":
+        return NdjsonAstWriter(f, sort)
+    return JsonAstWriter(f, compact)
+
+
+def dumpTypes(f: IO[str], types: dict, compact: bool = False):
+    """
+    Writes the types map as json
+    """
+    if compact:
+        json.dump(types, f, separators=(",", ":"), sort_keys=False, default=asDict)
+    else:
+        json.dump(types, f, indent=4, sort_keys=False, default=asDict)
+
+
+def writeConversion(
+    parser,
+    ignoredMacros: List[str],
+    prefix: str,
+    outputFormat: str,
+    compact: bool,
+    schema: str = "v1",
+    sort: bool = False,
+):
+    """
+    Parses the headers of a parser and writes <prefix>.ast.<format> and
+    <prefix>.types.json, writing out declarations as each header finishes parsing. The
+    fingerprint of the whole AST is written to <prefix>.ast.<format>.fingerprint
+    @param parser: A CHeaderParser created with parse=False
+    @param ignoredMacros: A list of macros to ignore
+    @param prefix: File name prefix of the output files
+    @param outputFormat: One of AST_FORMATS
+    @param compact: Write json without indentation
+    @param schema: One of SCHEMAS, v2 is only supported by the json format
+    @param sort: Sort the records by kind and spelling, only supported by the ndjson
+        format
+    """
+    mode = "wb+" if outputFormat == "bin" else "w+"
+    astPath = f"{prefix}.ast.{outputFormat}"
+    fingerprints = []
+    with open(astPath, mode) as f:
+        with openAstWriter(f, outputFormat, compact, schema, sort) as writer:
+            for key, record in parser.iterCHeaderFiles(
+                parser.headerFiles, ignoredMacros
+            ):
+                with parser.stats.timed("serialize"):
+                    writer.write(key, record)
+                fingerprints.append(record.get("fingerprint"))
+    writeAstFingerprint(astPath, combineFingerprints(fingerprints))
+
+    with parser.stats.timed("serialize"):
+        with open(f"{prefix}.types.json", "w+") as f:
+            if schema == "v2":
+                dumpTypesV2(f, parser.types, writer.functions, compact)
+            else:
+                dumpTypes(f, parser.types, compact)
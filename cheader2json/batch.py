@@ -0,0 +1,343 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Converts many sets of header files listed in a TOML manifest on a pool of worker
+processes. Top level keys set the pool options and the defaults of every job:
+
+    workers = 4
+    max-memory = 2048
+    ignore-macros = ["HELICS_EXPORT"]
+
+    [[jobs]]
+    headers = ["helics-3.0/helics.h"]
+    prefix = "out/helics-3.0"
+
+    [[jobs]]
+    headers = ["helics-3.1/helics.h", "helics-3.1/helics_enums.h"]
+    prefix = "out/helics-3.1"
+    format = "bin"
+
+Each job has headers and a prefix, and may override ignore-macros, deprecation-macros,
+annotation-macros, format, compact, schema and sort. Relative paths are relative to the
+directory of the manifest.
+"""
+
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, NamedTuple, Optional
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+from cheader2json.ast_writer import writeConversion
+from cheader2json.cheader_reader import CHeaderParser
+from cheader2json.constants import AST_FORMATS, SCHEMAS
+from cheader2json.fingerprint import FINGERPRINT_SUFFIX
+
+# Options that can be given for every job at the top level of the manifest
+_JOB_DEFAULTS = {
+    "ignore-macros": [],
+    "deprecation-macros": ["HELICS_DEPRECATED"],
+    "annotation-macros": [],
+    "format": "json",
+    "compact": False,
+    "schema": "v1",
+    "sort": False,
+}
+_BATCH_KEYS = {"workers", "max-memory", "jobs"} | set(_JOB_DEFAULTS)
+_JOB_KEYS = {"headers", "prefix"} | set(_JOB_DEFAULTS)
+
+
+class ManifestError(Exception):
+    pass
+
+
+class BatchJob(NamedTuple):
+    """
+    A set of header files to convert to one pair of output files
+    """
+
+    headers: List[str]
+    prefix: str
+    ignoredMacros: List[str]
+    deprecationMacros: List[str]
+    annotationMacros: List[str]
+    outputFormat: str = "json"
+    compact: bool = False
+    schema: str = "v1"
+    sort: bool = False
+
+
+class Manifest(NamedTuple):
+    """
+    The jobs and pool options of a manifest
+
+    @ivar workers: Number of worker processes, the number of CPUs if None
+    @ivar maxMemory: Limit on the address space of each worker process in MiB, or None
+    """
+
+    jobs: List[BatchJob]
+    workers: Optional[int] = None
+    maxMemory: Optional[int] = None
+
+
+class JobResult(NamedTuple):
+    """
+    The outcome of a job
+
+    @ivar status: "ok" or "failed"
+    @ivar seconds: Wall time of the job in its worker process
+    @ivar phases: Seconds spent in each phase of the conversion, see ParseStats
+    @ivar error: What went wrong, for failed jobs
+    """
+
+    prefix: str
+    status: str
+    seconds: float
+    phases: dict
+    error: Optional[str] = None
+
+
+def _positiveInt(table: dict, key: str, where: str) -> Optional[int]:
+    value = table.get(key)
+    if value is not None and (
+        not isinstance(value, int) or isinstance(value, bool) or value < 1
+    ):
+        raise ManifestError(f"{key} in {where} must be a positive integer")
+    return value
+
+
+def _stringList(table: dict, key: str, where: str) -> List[str]:
+    value = table[key]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ManifestError(f"{key} in {where} must be a list of strings")
+    return value
+
+
+def loadManifest(path: str) -> Manifest:
+    """
+    Reads a batch manifest
+    @param path: Path to the TOML manifest
+    """
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ManifestError(f"Error reading {path}: {e}") from e
+    unknown = sorted(set(data) - _BATCH_KEYS)
+    if unknown:
+        raise ManifestError(f"Unknown keys in {path}: {', '.join(unknown)}")
+    baseDir = os.path.dirname(os.path.abspath(path))
+    defaults = dict(_JOB_DEFAULTS)
+    defaults.update((k, v) for k, v in data.items() if k in _JOB_DEFAULTS)
+
+    jobs = []
+    for number, table in enumerate(data.get("jobs", []), 1):
+        where = f"job {number} of {path}"
+        if not isinstance(table, dict):
+            raise ManifestError(f"{where} is not a table")
+        unknown = sorted(set(table) - _JOB_KEYS)
+        if unknown:
+            raise ManifestError(f"Unknown keys in {where}: {', '.join(unknown)}")
+        if "headers" not in table or "prefix" not in table:
+            raise ManifestError(f"{where} needs headers and a prefix")
+        options = dict(defaults)
+        options.update(table)
+        for key in (
+            "headers",
+            "ignore-macros",
+            "deprecation-macros",
+            "annotation-macros",
+        ):
+            _stringList(options, key, where)
+        if options["format"] not in AST_FORMATS:
+            raise ManifestError(
+                f"format in {where} must be one of {', '.join(AST_FORMATS)}"
+            )
+        if options["schema"] not in SCHEMAS:
+            raise ManifestError(
+                f"schema in {where} must be one of {', '.join(SCHEMAS)}"
+            )
+        if options["schema"] == "v2" and options["format"] != "json":
+            raise ManifestError(f"schema v2 in {where} needs the json format")
+        if options["sort"] and options["format"] != "ndjson":
+            raise ManifestError(f"sort in {where} needs the ndjson format")
+        jobs.append(
+            BatchJob(
+                [os.path.join(baseDir, h) for h in options["headers"]],
+                os.path.join(baseDir, str(options["prefix"])),
+                options["ignore-macros"],
+                options["deprecation-macros"],
+                options["annotation-macros"],
+                options["format"],
+                bool(options["compact"]),
+                options["schema"],
+                bool(options["sort"]),
+            )
+        )
+    if not jobs:
+        raise ManifestError(f"No jobs in {path}")
+    return Manifest(
+        jobs,
+        _positiveInt(data, "workers", path),
+        _positiveInt(data, "max-memory", path),
+    )
+
+
+def _initWorker(maxMemory: Optional[int]):
+    if maxMemory is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows, run without a limit
+        return
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = maxMemory * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _describeError(e: BaseException) -> str:
+    message = str(e) or type(e).__name__
+    if e.__cause__ is not None:
+        message += f" ({type(e.__cause__).__name__}: {e.__cause__})"
+    return message
+
+
+def _runJob(job: BatchJob) -> JobResult:
+    """
+    Converts the headers of a job in a worker process. Jobs run one at a time in each
+    worker process, so they all parse with the clang index of its main thread.
+    """
+    start = time.perf_counter()
+    parser = None
+    try:
+        parser = CHeaderParser(
+            job.headers,
+            job.ignoredMacros,
+            parse=False,
+            deprecationMacros=job.deprecationMacros,
+            annotationMacros=job.annotationMacros,
+        )
+        writeConversion(
+            parser,
+            job.ignoredMacros,
+            job.prefix,
+            job.outputFormat,
+            job.compact,
+            job.schema,
+            job.sort,
+        )
+    except Exception as e:
+        # Don't leave truncated output files behind
+        for path in (
+            f"{job.prefix}.ast.{job.outputFormat}",
+            f"{job.prefix}.ast.{job.outputFormat}{FINGERPRINT_SUFFIX}",
+            f"{job.prefix}.types.json",
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        return JobResult(
+            job.prefix,
+            "failed",
+            time.perf_counter() - start,
+            dict(parser.stats.phases) if parser else {},
+            _describeError(e),
+        )
+    return JobResult(
+        job.prefix, "ok", time.perf_counter() - start, dict(parser.stats.phases)
+    )
+
+
+def runBatch(
+    jobs: List[BatchJob],
+    workers: Optional[int] = None,
+    maxMemory: Optional[int] = None,
+    onResult: Optional[Callable[[JobResult], None]] = None,
+) -> List[JobResult]:
+    """
+    Runs jobs on a pool of worker processes, at most one job per worker at a time
+
+    A failing job does not affect the others. A worker process that dies (e.g. when
+    libclang aborts after running into the memory limit) takes down the jobs running
+    alongside it, so those jobs are run again one at a time after the other jobs, and
+    only the job a worker dies on while running alone is reported as failed.
+    @param jobs: The jobs to run
+    @param workers: Number of worker processes, the number of CPUs if not given
+    @param maxMemory: Limit on the address space of each worker process in MiB, not
+        supported on Windows
+    @param onResult: Called with the result of each job as soon as it finishes
+    @return: The result of each job, in the order the jobs were given
+    """
+    workers = workers or os.cpu_count() or 1
+    results: List[Optional[JobResult]] = [None] * len(jobs)
+    pending = deque(range(len(jobs)))
+    retries = deque()
+    running = {}
+
+    def finish(i: int, result: JobResult):
+        results[i] = result
+        if onResult:
+            onResult(result)
+
+    def newPool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=min(workers, len(jobs)),
+            initializer=_initWorker,
+            initargs=(maxMemory,),
+        )
+
+    pool = newPool()
+    try:
+        while pending or retries or running:
+            if pending:
+                while pending and len(running) < workers:
+                    i = pending.popleft()
+                    running[pool.submit(_runJob, jobs[i])] = i
+            elif retries and not running:
+                i = retries.popleft()
+                running[pool.submit(_runJob, jobs[i])] = i
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if not any(isinstance(f.exception(), BrokenProcessPool) for f in done):
+                for future in done:
+                    finish(running.pop(future), future.result())
+                continue
+            # Every running job fails along with the broken pool
+            done, _ = wait(running)
+            lost = []
+            for future in done:
+                i = running.pop(future)
+                if isinstance(future.exception(), BrokenProcessPool):
+                    lost.append(i)
+                else:
+                    finish(i, future.result())
+            if len(lost) == 1:
+                finish(
+                    lost[0],
+                    JobResult(
+                        jobs[lost[0]].prefix,
+                        "failed",
+                        0.0,
+                        {},
+                        "The worker process died while running the job",
+                    ),
+                )
+            else:
+                retries.extend(lost)
+            pool.shutdown(wait=True)
+            pool = newPool()
+    finally:
+        pool.shutdown(wait=True)
+    return results
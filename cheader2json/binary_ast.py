@@ -0,0 +1,450 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Binary AST format with random access to top level declarations.
+
+Layout (all integers little-endian):
+    header        magic, version, declaration count and section offsets
+    payloads      compact JSON of each full declaration record, in parsedInfo order
+    declarations  fixed-width records (key, kind, spelling, location, start/end line,
+                  payload offset and length, fingerprint and flags), sorted by key
+    strings       sorted string table, so string ids compare like the strings do
+    index         (kind, spelling, declaration) entries sorted by kind and spelling
+"""
+
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+from cheader2json.declarations import asDict
+
+MAGIC = b"C2JBAST\0"
+VERSION = 2
+
+_HEADER = struct.Struct("<8sIIQQQ")
+# Version 1 declaration records have no fingerprint and flags
+_DECLARATIONS = {1: struct.Struct("<IIIIIIQI"), 2: struct.Struct("<IIIIIIQI16sB")}
+_DECLARATION = _DECLARATIONS[VERSION]
+_INDEX_ENTRY = struct.Struct("<III")
+_COUNT = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+
+# Flags of a declaration record, telling which of the fields kept in the declaration
+# table the record has
+_HAS_LINES = 1
+_HAS_FINGERPRINT = 2
+_HAS_DEPRECATED = 4
+_DEPRECATED = 8
+
+# Fields of a record that are kept in the declaration table of a version 2 file
+TABLE_FIELDS = frozenset(
+    (
+        "kind",
+        "spelling",
+        "location",
+        "start_line",
+        "end_line",
+        "fingerprint",
+        "deprecated",
+    )
+)
+
+
+class BinaryAstWriter(object):
+    """
+    Writes top level AST records to the binary AST format one record at a time
+
+    Payloads are written as records arrive, only the fixed-width metadata of each
+    record is kept in memory until the tables are written on close.
+    """
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+        self._declarations = []
+        self._strings = set()
+        # Placeholder header, rewritten with the section offsets on close
+        self.f.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+        self._offset = _HEADER.size
+
+    def write(self, key, record: dict):
+        """
+        Writes a single top level record
+        @param key: The parsedInfo key of the record
+        @param record: The cursor info record
+        """
+        payload = json.dumps(record, separators=(",", ":"), default=asDict).encode(
+            "utf-8"
+        )
+        self.f.write(payload)
+        kind, spelling, location = (
+            record["kind"],
+            record["spelling"] or "",
+            record["location"] or "",
+        )
+        self._strings.update((kind, spelling, location))
+        flags = 0
+        if "start_line" in record:
+            flags |= _HAS_LINES
+        fingerprint = record.get("fingerprint")
+        if fingerprint is not None:
+            flags |= _HAS_FINGERPRINT
+        if "deprecated" in record:
+            flags |= _HAS_DEPRECATED | (_DEPRECATED if record["deprecated"] else 0)
+        self._declarations.append(
+            (
+                int(key),
+                kind,
+                spelling,
+                location,
+                record.get("start_line", 0),
+                record.get("end_line", 0),
+                self._offset,
+                len(payload),
+                bytes.fromhex(fingerprint) if fingerprint is not None else bytes(16),
+                flags,
+            )
+        )
+        self._offset += len(payload)
+
+    def close(self):
+        """
+        Writes the declaration table, string table and index, then the header
+        """
+        strings = sorted(self._strings)
+        stringIds = {s: i for i, s in enumerate(strings)}
+
+        declarationsOffset = self._offset
+        for (
+            key,
+            kind,
+            spelling,
+            location,
+            start,
+            end,
+            offset,
+            length,
+            fingerprint,
+            flags,
+        ) in sorted(self._declarations):
+            self.f.write(
+                _DECLARATION.pack(
+                    key,
+                    stringIds[kind],
+                    stringIds[spelling],
+                    stringIds[location],
+                    start,
+                    end,
+                    offset,
+                    length,
+                    fingerprint,
+                    flags,
+                )
+            )
+
+        stringsOffset = declarationsOffset + len(self._declarations) * _DECLARATION.size
+        encoded = [s.encode("utf-8") for s in strings]
+        self.f.write(_COUNT.pack(len(encoded)))
+        position = 0
+        for data in encoded:
+            self.f.write(_OFFSET.pack(position))
+            position += len(data)
+        self.f.write(_OFFSET.pack(position))
+        for data in encoded:
+            self.f.write(data)
+
+        indexOffset = (
+            stringsOffset + _COUNT.size + (len(encoded) + 1) * _OFFSET.size + position
+        )
+        declarationNums = {
+            decl[0]: num for num, decl in enumerate(sorted(self._declarations))
+        }
+        for entry in sorted(
+            (stringIds[decl[1]], stringIds[decl[2]], declarationNums[decl[0]])
+            for decl in self._declarations
+        ):
+            self.f.write(_INDEX_ENTRY.pack(*entry))
+
+        self.f.seek(0)
+        self.f.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                len(self._declarations),
+                declarationsOffset,
+                stringsOffset,
+                indexOffset,
+            )
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BinaryAst(Mapping):
+    """
+    Read-only view of a binary AST file, with the same shape as a loaded AST json file
+
+    The file is memory-mapped and declarations are only decoded when they are accessed.
+    Keys are strings, the same as the keys of a loaded AST json file.
+    """
+
+    def __init__(self, source: Union[IO[bytes], bytes]):
+        if isinstance(source, (bytes, bytearray)):
+            self._buffer = source
+        else:
+            try:
+                self._buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError, AttributeError):
+                # Not backed by a regular file (e.g. a pipe), read it into memory instead
+                self._buffer = source.read()
+        (
+            magic,
+            version,
+            self._count,
+            self._declarationsOffset,
+            stringsOffset,
+            self._indexOffset,
+        ) = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a binary AST file")
+        if version not in _DECLARATIONS:
+            raise ValueError(f"Unsupported binary AST version {version}")
+        self._declarationStruct = _DECLARATIONS[version]
+        # Fields that can be read without decoding a record
+        self._tableFields = TABLE_FIELDS if version >= 2 else frozenset()
+        self._stringCache: Dict[int, str] = {}
+        (self._stringCount,) = _COUNT.unpack_from(self._buffer, stringsOffset)
+        self._stringOffsetsOffset = stringsOffset + _COUNT.size
+        self._stringDataOffset = (
+            self._stringOffsetsOffset + (self._stringCount + 1) * _OFFSET.size
+        )
+
+    @staticmethod
+    def isBinaryAst(f: IO[bytes]) -> bool:
+        """
+        Checks if a file starts with the binary AST magic bytes, without consuming it
+        @param f: A buffered binary file object
+        """
+        return f.peek(len(MAGIC))[: len(MAGIC)] == MAGIC
+
+    def _string(self, stringId: int) -> str:
+        start, end = struct.unpack_from(
+            "<QQ", self._buffer, self._stringOffsetsOffset + stringId * _OFFSET.size
+        )
+        return bytes(
+            self._buffer[self._stringDataOffset + start : self._stringDataOffset + end]
+        ).decode("utf-8")
+
+    def _stringId(self, value: str) -> Optional[int]:
+        low, high = 0, self._stringCount
+        while low < high:
+            mid = (low + high) // 2
+            if self._string(mid) < value:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._stringCount and self._string(low) == value:
+            return low
+        return None
+
+    def _declaration(self, num: int) -> tuple:
+        return self._declarationStruct.unpack_from(
+            self._buffer,
+            self._declarationsOffset + num * self._declarationStruct.size,
+        )
+
+    def _record(self, num: int) -> dict:
+        offset, length = self._declaration(num)[6:8]
+        return json.loads(bytes(self._buffer[offset : offset + length]))
+
+    def _cachedString(self, stringId: int) -> str:
+        # Kinds and locations repeat across declarations, keep a single copy of each
+        value = self._stringCache.get(stringId)
+        if value is None:
+            value = self._stringCache[stringId] = self._string(stringId)
+        return value
+
+    def _tableRecord(self, num: int) -> dict:
+        """
+        Gets the fields of a declaration that are kept in the declaration table
+        """
+        declaration = self._declaration(num)
+        fields = {
+            "kind": self._cachedString(declaration[1]),
+            "spelling": self._cachedString(declaration[2]),
+            "location": self._cachedString(declaration[3]),
+        }
+        if not self._tableFields:
+            return fields
+        fingerprint, flags = declaration[8:]
+        if flags & _HAS_LINES:
+            fields["start_line"], fields["end_line"] = declaration[4:6]
+        if flags & _HAS_FINGERPRINT:
+            fields["fingerprint"] = fingerprint.hex()
+        if flags & _HAS_DEPRECATED:
+            fields["deprecated"] = bool(flags & _DEPRECATED)
+        return fields
+
+    def _indexEntry(self, position: int) -> tuple:
+        return _INDEX_ENTRY.unpack_from(
+            self._buffer, self._indexOffset + position * _INDEX_ENTRY.size
+        )
+
+    def _indexLowerBound(self, kindId: int, spellingId: int) -> int:
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._indexEntry(mid)[:2] < (kindId, spellingId):
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _find(self, kind: str, spelling: Optional[str]) -> Iterator[int]:
+        kindId = self._stringId(kind)
+        spellingId = 0 if spelling is None else self._stringId(spelling)
+        if kindId is None or spellingId is None:
+            return
+        position = self._indexLowerBound(kindId, spellingId)
+        while position < self._count:
+            entryKind, entrySpelling, num = self._indexEntry(position)
+            if entryKind != kindId or (
+                spelling is not None and entrySpelling != spellingId
+            ):
+                return
+            yield num
+            position += 1
+
+    def findAll(self, kind: str) -> List[dict]:
+        """
+        Gets all top level records of a kind, in parsedInfo order
+        @param kind: The cursor kind name, e.g. FUNCTION_DECL
+        """
+        return [self._record(num) for num in sorted(self._find(kind, None))]
+
+    def lookup(self, spelling: str, kind: Optional[str] = None) -> List[dict]:
+        """
+        Gets the top level records with a spelling, in parsedInfo order
+        @param spelling: The name of the declaration
+        @param kind: The cursor kind name, any kind if not given
+        """
+        kinds = [kind] if kind is not None else self.kinds()
+        nums = []
+        for k in kinds:
+            nums.extend(self._find(k, spelling))
+        return [self._record(num) for num in sorted(nums)]
+
+    def kinds(self) -> List[str]:
+        """
+        Gets the distinct kinds of the top level records
+        """
+        kinds = []
+        position = 0
+        while position < self._count:
+            kindId = self._indexEntry(position)[0]
+            kinds.append(self._string(kindId))
+            # Skip past every entry of this kind
+            position = self._indexLowerBound(kindId + 1, 0)
+        return kinds
+
+    def _num(self, key) -> Optional[int]:
+        try:
+            key = int(key)
+        except (TypeError, ValueError):
+            return None
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._declaration(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._count and self._declaration(low)[0] == key:
+            return low
+        return None
+
+    def __getitem__(self, key) -> dict:
+        num = self._num(key)
+        if num is None:
+            raise KeyError(key)
+        return self._record(num)
+
+    def __iter__(self) -> Iterator[str]:
+        for num in range(self._count):
+            yield str(self._declaration(num)[0])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def values(self) -> Iterator[dict]:
+        for num in range(self._count):
+            yield self._record(num)
+
+    def items(self) -> Iterator[tuple]:
+        for num in range(self._count):
+            yield str(self._declaration(num)[0]), self._record(num)
+
+    def lazyItems(self) -> Iterator[Tuple[str, "LazyRecord"]]:
+        """
+        Gets the keys and records of the declarations without decoding them, each record
+        is only decoded when a field that is not in the declaration table is accessed
+        """
+        for num in range(self._count):
+            yield (
+                str(self._declaration(num)[0]),
+                LazyRecord(self, num, self._tableRecord(num)),
+            )
+
+
+class LazyRecord(Mapping):
+    """
+    A declaration of a binary AST, read from the declaration table until a field that is
+    not kept there is accessed, which decodes the whole record
+    """
+
+    __slots__ = ("_ast", "_num", "_fields", "_record")
+
+    def __init__(self, ast: BinaryAst, num: int, fields: dict):
+        self._ast = ast
+        self._num = num
+        self._fields = fields
+        self._record = None
+
+    def toDict(self) -> dict:
+        """
+        Decodes the record
+        """
+        if self._record is None:
+            self._record = self._ast._record(self._num)
+        return self._record
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return self._fields[key]
+        if key in self._ast._tableFields:
+            # Kept in the table for every record that has it
+            raise KeyError(key)
+        return self.toDict()[key]
+
+    def __contains__(self, key) -> bool:
+        if key in self._ast._tableFields or key in self._fields:
+            return key in self._fields
+        return key in self.toDict()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.toDict())
+
+    def __len__(self) -> int:
+        return len(self.toDict())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.toDict()!r})"
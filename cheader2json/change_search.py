@@ -1,297 +1,459 @@
-def findAll(ast, kindtype):
-    items = []
-    for val in ast.values():
-        if val["kind"] == kindtype:
-            items.append(val)
+import json
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from cheader2json.ast_index import AstIndex
+from cheader2json.ast_writer import sortKey
+from cheader2json.schema_v2 import childRecords
+
+KNOWN_KINDS = [
+    "FUNCTION_DECL",
+    "TYPEDEF_DECL",
+    "ENUM_DECL",
+    "VAR_DECL",
+    "STRUCT_DECL",
+    "MACRO_DEFINITION",
+    "MACRO_INSTANTIATION",
+    "INCLUSION_DIRECTIVE",
+]
+
+
+class Change(NamedTuple):
+    """
+    A single difference between two ASTs
+
+    @ivar change: "added", "removed", "changed", or "unknown" for declarations of a kind the diff does not handle
+    @ivar kind: The cursor kind of the entity, e.g. FUNCTION_DECL or PARM_DECL
+    @ivar path: Names leading to the entity, e.g. (function, parameter)
+    @ivar field: The attribute that changed, for "changed" records
+    @ivar old: The old value of the attribute
+    @ivar new: The new value of the attribute, or a summary of an added entity
+    """
+
+    change: str
+    kind: str
+    path: Tuple[str, ...]
+    field: Optional[str] = None
+    old: Any = None
+    new: Any = None
+
+
+def indexAst(ast) -> dict:
+    """
+    Indexes the top level declarations of an AST in a single pass
+    @param ast: A loaded AST, or an AstIndex to reuse
+    @return: {kind: {spelling: declaration}}, plus the names of deprecated functions
+        under "deprecated" and the declarations of unknown kinds under "unknown"
+    """
+    if not isinstance(ast, AstIndex):
+        ast = AstIndex(ast)
+    index = {kind: ast.declarations(kind) for kind in KNOWN_KINDS}
+    index["deprecated"] = ast.deprecated
+    index["unknown"] = [val for val in ast.values() if val["kind"] not in index]
+    return index
+
+
+def _byName(children, kindtype: str) -> dict:
+    items = {}
+    for v in childRecords(children):
+        if v["kind"] == kindtype:
+            items[v["spelling"]] = v
     return items
 
 
-def findAllWithStartLine(ast, kindtype, startline):
-    items = []
-    for val in ast.values():
-        if val["kind"] == kindtype:
-            if val["start_line"] == startline:
-                items.append(val)
-    return items
-
-
-def findUnknownKinds(ast):
-    knowntypes = [
-        "FUNCTION_DECL",
-        "TYPEDEF_DECL",
-        "ENUM_DECL",
-        "VAR_DECL",
-        "STRUCT_DECL",
-        "MACRO_DEFINITION",
-        "MACRO_INSTANTIATION",
-        "INCLUSION_DIRECTIVE",
-    ]
-    _knownsubtypes = ["PARM_DECL", "ENUM_CONSTANT_DECL", "FIELD_DECL"]
-    for val in ast.values():
-        if val["kind"] not in knowntypes:
-            print(f"Unknown Kind Type: {val['kind']}")
+def _diffNames(old: dict, new: dict, kind: str, path: tuple = ()) -> Iterator[Change]:
+    for name in new:
+        if name not in old:
+            yield Change("added", kind, path + (name,))
+    for name in old:
+        if name not in new:
+            yield Change("removed", kind, path + (name,))
+
+
+def _diffFields(
+    old: dict, new: dict, kind: str, path: tuple, fields: tuple
+) -> Iterator[Change]:
+    for field in fields:
+        if new.get(field) != old.get(field):
+            yield Change("changed", kind, path, field, old.get(field), new.get(field))
+
+
+def _argumentsSummary(function: dict) -> str:
+    args = []
+    # In order and not by name, parameters can be unnamed or share a name
+    for v in childRecords(function["arguments"]):
+        if v["kind"] != "PARM_DECL":
+            continue
+        args.append(
+            v["pointer_underlying_type"]
+            + "*" * v["pointer_depth"]
+            + " "
+            + v["spelling"]
+        )
+    return ", ".join(args)
+
+
+def _unchanged(old: dict, new: dict) -> bool:
+    # ASTs converted before declarations had fingerprints are always compared in full
+    fingerprint = old.get("fingerprint")
+    return fingerprint is not None and fingerprint == new.get("fingerprint")
+
+
+def _functionChanges(name: str, old: dict, new: dict) -> Iterator[Change]:
+    # pointer types are only compared when the new function returns a pointer
+    fields = ("result_type",) + tuple(
+        field for field in ("pointer_type", "double_pointer_type") if field in new
+    )
+    yield from _diffFields(old, new, "FUNCTION_DECL", (name,), fields)
+
+
+def _parameterChanges(name: str, old: dict, new: dict) -> Iterator[Change]:
+    f_old = old["arguments"]
+    f_new = new["arguments"]
+    if len(f_old) == len(f_new):
+        # same number of arguments, compare them in order
+        for old_param, new_param in zip(childRecords(f_old), childRecords(f_new)):
+            fields = ("type",) + tuple(
+                field
+                for field in ("pointer_type", "double_pointer_type")
+                if field in new_param
+            )
+            yield from _diffFields(
+                old_param,
+                new_param,
+                "PARM_DECL",
+                (name, new_param["spelling"]),
+                fields,
+            )
+    yield from _diffNames(
+        _byName(f_old, "PARM_DECL"),
+        _byName(f_new, "PARM_DECL"),
+        "PARM_DECL",
+        (name,),
+    )
+
+
+def _constantChanges(name: str, old: dict, new: dict) -> Iterator[Change]:
+    old_constants = _byName(old["enumerations"], "ENUM_CONSTANT_DECL")
+    new_constants = _byName(new["enumerations"], "ENUM_CONSTANT_DECL")
+    for change in _diffNames(
+        old_constants, new_constants, "ENUM_CONSTANT_DECL", (name,)
+    ):
+        if change.change == "added":
+            change = change._replace(new=new_constants[change.path[1]]["value"])
+        yield change
+    for c in new_constants:
+        if c in old_constants:
+            yield from _diffFields(
+                old_constants[c],
+                new_constants[c],
+                "ENUM_CONSTANT_DECL",
+                (name, c),
+                ("value", "type"),
+            )
+
+
+def _memberChanges(name: str, old: dict, new: dict) -> Iterator[Change]:
+    old_fields = _byName(old["members"], "FIELD_DECL")
+    new_fields = _byName(new["members"], "FIELD_DECL")
+    yield from _diffNames(old_fields, new_fields, "FIELD_DECL", (name,))
+    for f in new_fields:
+        if f in old_fields:
+            yield from _diffFields(
+                old_fields[f], new_fields[f], "FIELD_DECL", (name, f), ("type",)
+            )
+
+
+def _deprecationChange(name: str, old: bool, new: bool) -> Iterator[Change]:
+    if new and not old:
+        yield Change("changed", "FUNCTION_DECL", (name,), "deprecated", False, True)
+    elif old and not new:
+        yield Change("changed", "FUNCTION_DECL", (name,), "deprecated", True, False)
+
+
+def iterChanges(old_ast, new_ast) -> Iterator[Change]:
+    """
+    Compares two ASTs, declarations with the same fingerprint in both are not compared
+    field by field
+    @param old_ast: The old AST, or an AstIndex of it
+    @param new_ast: The new AST, or an AstIndex of it
+    @return: The changes, in the order the human-readable diff lists them
+    """
+    old_index = indexAst(old_ast)
+    new_index = indexAst(new_ast)
 
-
-def diffAst(old_ast, new_ast):
     # FUNCTION_DECL
-    old_functions = {}
-    for v in findAll(old_ast, "FUNCTION_DECL"):
-        old_functions[v["spelling"]] = v
-
-    new_functions = {}
-    for v in findAll(new_ast, "FUNCTION_DECL"):
-        new_functions[v["spelling"]] = v
-
+    old_functions = old_index["FUNCTION_DECL"]
+    new_functions = new_index["FUNCTION_DECL"]
+    for change in _diffNames(old_functions, new_functions, "FUNCTION_DECL"):
+        if change.change == "added":
+            change = change._replace(
+                new=_argumentsSummary(new_functions[change.path[0]])
+            )
+        yield change
     for f in new_functions:
-        if f not in old_functions:
-            first_arg = True
-            args_str = ""
-            for v in findAll(new_functions[f]["arguments"], "PARM_DECL"):
-                if not first_arg:
-                    args_str += ", "
-                args_str += v["pointer_underlying_type"]
-                args_str += "*" * v["pointer_depth"]
-                args_str += " " + v["spelling"]
-                first_arg = False
-            print(f"New function: {f} ({args_str})")
-    for f in old_functions:
-        if f not in new_functions:
-            print(f"Removed function: {f}")
-    for f in new_functions:
-        if f in old_functions:
-            if new_functions[f]["result_type"] != old_functions[f]["result_type"]:
-                print(
-                    f"Changed return type in {f} from {old_functions[f]['result_type']} to {new_functions[f]['result_type']}"
-                )
-            if "pointer_type" in new_functions[f]:
-                if new_functions[f]["pointer_type"] != old_functions[f]["pointer_type"]:
-                    print(
-                        f"Changed return pointer type in {f} from {old_functions[f]['pointer_type']} to {new_functions[f]['pointer_type']}"
-                    )
-            if "double_pointer_type" in new_functions[f]:
-                if (
-                    new_functions[f]["double_pointer_type"]
-                    != old_functions[f]["double_pointer_type"]
-                ):
-                    print(
-                        f"Changed return double pointer type in {f} from {old_functions[f]['double_pointer_type']} to {new_functions[f]['double_pointer_type']}"
-                    )
+        if f in old_functions and not _unchanged(old_functions[f], new_functions[f]):
+            yield from _functionChanges(f, old_functions[f], new_functions[f])
 
     # function["arguments"] -> PARM_DECL
     for k in new_functions:
-        f_new = new_functions[k]
-        if k in old_functions:
-            f_old = old_functions[k]
-            if len(f_old["arguments"]) != len(f_new["arguments"]):
-                # the number of arguments doesn't match, something was added or removed
-                old_params = {}
-                for v in findAll(f_old["arguments"], "PARM_DECL"):
-                    old_params[v["spelling"]] = v
-                new_params = {}
-                for v in findAll(f_new["arguments"], "PARM_DECL"):
-                    new_params[v["spelling"]] = v
-                for p in new_params:
-                    if p not in old_params:
-                        print(f"New parameter {p} added to function {k}")
-                for p in old_params:
-                    if p not in new_params:
-                        print(f"Removed parameter {p} from function {k}")
-            else:
-                # check if the same arguments appear in the same order
-                for param_k in f_new["arguments"].keys():
-                    new_param = f_new["arguments"][param_k]
-                    old_param = f_old["arguments"][param_k]
-                    if new_param["type"] != old_param["type"]:
-                        print(
-                            f"Changed type for param {new_param['spelling']} in {k} from {old_param['type']} to {new_param['type']}"
-                        )
-                    # pointer_type
-                    if "pointer_type" in new_param:
-                        if new_param["pointer_type"] != old_param["pointer_type"]:
-                            print(
-                                f"Changed pointer type for param {new_param['spelling']} in {k} from {old_param['pointer_type']} to {new_param['pointer_type']}"
-                            )
-                    # double_pointer_type
-                    if "double_pointer_type" in new_param:
-                        if (
-                            new_param["double_pointer_type"]
-                            != old_param["double_pointer_type"]
-                        ):
-                            print(
-                                f"Changed double pointer type for param {new_param['spelling']} in {k} from {old_param['double_pointer_type']} to {new_param['double_pointer_type']}"
-                            )
-
-            # TODO may be better not to construct these new lists and instead iterate by keys() using findAll results
-            old_params = {}
-            for v in findAll(f_old["arguments"], "PARM_DECL"):
-                old_params[v["spelling"]] = v
-            new_params = {}
-            for v in findAll(f_new["arguments"], "PARM_DECL"):
-                new_params[v["spelling"]] = v
-            for p in new_params:
-                if p not in old_params:
-                    print(f"New parameter {p} added to function {k}")
-            for p in old_params:
-                if p not in new_params:
-                    print(f"Removed parameter {p} from function {k}")
-            for p in new_params:
-                if p in old_params:
-                    # Parameter order matters, so should iterate through both parameter lists in order and compare
-                    pass
+        if k in old_functions and not _unchanged(old_functions[k], new_functions[k]):
+            yield from _parameterChanges(k, old_functions[k], new_functions[k])
 
     # TYPEDEF_DECL
-    old_typedefs = {}
-    for v in findAll(old_ast, "TYPEDEF_DECL"):
-        old_typedefs[v["spelling"]] = v
-
-    new_typedefs = {}
-    for v in findAll(new_ast, "TYPEDEF_DECL"):
-        new_typedefs[v["spelling"]] = v
-
-    for t in new_typedefs:
-        if t not in old_typedefs:
-            print(f"New typedef: {t}")
-    for t in old_typedefs:
-        if t not in new_typedefs:
-            print(f"Removed typedef: {t}")
-    # TYPEDEF
+    yield from _diffNames(
+        old_index["TYPEDEF_DECL"], new_index["TYPEDEF_DECL"], "TYPEDEF_DECL"
+    )
 
     # ENUM_DECL
-    old_enums = {}
-    for v in findAll(old_ast, "ENUM_DECL"):
-        old_enums[v["spelling"]] = v
-
-    new_enums = {}
-    for v in findAll(new_ast, "ENUM_DECL"):
-        new_enums[v["spelling"]] = v
-
-    for e in new_enums:
-        if e not in old_enums:
-            print(f"New enum: {e}")
-    for e in old_enums:
-        if e not in new_enums:
-            print(f"Removed enum: {e}")
+    old_enums = old_index["ENUM_DECL"]
+    new_enums = new_index["ENUM_DECL"]
+    yield from _diffNames(old_enums, new_enums, "ENUM_DECL")
 
     # enum["enumerations"] -> ENUM_CONSTANT_DECL
     for k in new_enums:
-        v_new = new_enums[k]
-        if k in old_enums:
-            v_old = old_enums[k]
-            old_constants = {}
-            for v in findAll(v_old["enumerations"], "ENUM_CONSTANT_DECL"):
-                old_constants[v["spelling"]] = v
-            new_constants = {}
-            for v in findAll(v_new["enumerations"], "ENUM_CONSTANT_DECL"):
-                new_constants[v["spelling"]] = v
-            for c in new_constants:
-                if c not in old_constants:
-                    print(f"New constant {c}={new_constants[c]['value']} in enum {k}")
-            for c in old_constants:
-                if c not in new_constants:
-                    print(f"Removed constant {c} from enum {k}")
-            for c in new_constants:
-                if c in old_constants:
-                    if new_constants[c]["value"] != old_constants[c]["value"]:
-                        print(
-                            f"Value of constant {c} in enum {k} changed from {old_constants[c]['value']} to {new_constants[c]['value']}"
-                        )
-                    if new_constants[c]["type"] != old_constants[c]["type"]:
-                        print(
-                            f"Type of constant {c} in enum {k} changed from {old_constants[c]['type']} to {new_constants[c]['type']}"
-                        )
+        if k in old_enums and not _unchanged(old_enums[k], new_enums[k]):
+            yield from _constantChanges(k, old_enums[k], new_enums[k])
 
     # VAR_DECL
-    old_vars = {}
-    for v in findAll(old_ast, "VAR_DECL"):
-        old_vars[v["spelling"]] = v
-
-    new_vars = {}
-    for v in findAll(new_ast, "VAR_DECL"):
-        new_vars[v["spelling"]] = v
-
-    for v in new_vars:
-        if v not in old_vars:
-            print(f"New var: {v}")
-    for v in old_vars:
-        if v not in new_vars:
-            print(f"Removed var: {v}")
+    yield from _diffNames(old_index["VAR_DECL"], new_index["VAR_DECL"], "VAR_DECL")
 
     # STRUCT_DECL
-    old_structs = {}
-    for v in findAll(old_ast, "STRUCT_DECL"):
-        old_structs[v["spelling"]] = v
-
-    new_structs = {}
-    for v in findAll(new_ast, "STRUCT_DECL"):
-        new_structs[v["spelling"]] = v
-
-    for s in new_structs:
-        if s not in old_structs:
-            print(f"New struct: {s}")
-    for s in old_structs:
-        if s not in new_structs:
-            print(f"Removed struct: {s}")
-    # struct["members"] -> FIELD_DECL
+    old_structs = old_index["STRUCT_DECL"]
+    new_structs = new_index["STRUCT_DECL"]
+    yield from _diffNames(old_structs, new_structs, "STRUCT_DECL")
 
+    # struct["members"] -> FIELD_DECL
     for k in new_structs:
-        s_new = new_structs[k]
-        if k in old_structs:
-            s_old = old_structs[k]
-            old_fields = {}
-            for v in findAll(s_old["members"], "FIELD_DECL"):
-                old_fields[v["spelling"]] = v
-            new_fields = {}
-            for v in findAll(s_new["members"], "FIELD_DECL"):
-                new_fields[v["spelling"]] = v
-            for f in new_fields:
-                if f not in old_fields:
-                    print(f"New field {f} in struct {k}")
-            for f in old_fields:
-                if f not in new_fields:
-                    print(f"Removed field {f} from struct {k}")
-            for f in new_fields:
-                if f in old_fields:
-                    if new_fields[f]["type"] != old_fields[f]["type"]:
-                        print(
-                            f"Type of field {f} in struct {k} changed from {old_fields[f]['type']} to {new_fields[f]['type']}"
-                        )
+        if k in old_structs and not _unchanged(old_structs[k], new_structs[k]):
+            yield from _memberChanges(k, old_structs[k], new_structs[k])
 
     # MACRO_DEFINITION
-    old_macros = {}
-    for v in findAll(old_ast, "MACRO_DEFINITIONS"):
-        old_macros[v["spelling"]] = v
-
-    new_macros = {}
-    for v in findAll(new_ast, "MACRO_DEFINITIONS"):
-        new_macros[v["spelling"]] = v
-
-    for m in new_macros:
-        if m not in old_macros:
-            print(f"New macro: {m}")
-    for m in old_macros:
-        if f not in new_macros:
-            print(f"Removed macro: {m}")
-
-    # MACRO_INSTANTIATION
-    old_deprecated_functions = {}
-    for v in findAll(old_ast, "MACRO_INSTANTIATION"):
-        if v["spelling"] == "HELICS_DEPRECATED":
-            for vf in findAllWithStartLine(old_ast, "FUNCTION_DECL", v["start_line"]):
-                old_deprecated_functions[vf["spelling"]] = vf
-
-    new_deprecated_functions = {}
-    for v in findAll(new_ast, "MACRO_INSTANTIATION"):
-        if v["spelling"] == "HELICS_DEPRECATED":
-            for vf in findAllWithStartLine(new_ast, "FUNCTION_DECL", v["start_line"]):
-                new_deprecated_functions[vf["spelling"]] = vf
-
-    for f in new_deprecated_functions:
-        if f not in old_deprecated_functions:
-            print(f"New deprecated function: {f}")
-    for f in old_deprecated_functions:
-        if f not in new_deprecated_functions:
-            print(f"Removed deprecated function: {f}")
+    yield from _diffNames(
+        old_index["MACRO_DEFINITION"], new_index["MACRO_DEFINITION"], "MACRO_DEFINITION"
+    )
+
+    # MACRO_INSTANTIATION -> deprecated functions
+    old_deprecated = old_index["deprecated"]
+    new_deprecated = new_index["deprecated"]
+    for f in new_deprecated:
+        if f not in old_deprecated:
+            yield from _deprecationChange(f, False, True)
+    for f in old_deprecated:
+        if f not in new_deprecated:
+            yield from _deprecationChange(f, True, False)
 
     # INCLUSION_DIRECTIVE
 
-    findUnknownKinds(new_ast)
+    for val in new_index["unknown"]:
+        yield Change("unknown", val["kind"], (val["spelling"],))
+
+
+class SortedAstError(Exception):
+    pass
+
+
+def readSortedNdjson(f, name: str = "the ast file") -> Iterator[dict]:
+    """
+    Reads the records of an ndjson AST file written with sort=True one line at a time,
+    checking they are in order
+    @param f: The ndjson file, in text or binary mode
+    @param name: The name of the file for error messages
+    """
+    previous = None
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            key = sortKey(record)
+        except (ValueError, TypeError, KeyError) as e:
+            raise SortedAstError(
+                f"Line {number} of {name} is not a record of an ndjson AST file"
+            ) from e
+        if previous is not None and key < previous:
+            raise SortedAstError(
+                f"{name} is not sorted by kind and spelling at line {number}, convert it "
+                "with --format=ndjson --sort"
+            )
+        previous = key
+        yield record
+
+
+class _Group(NamedTuple):
+    """
+    The consecutive records of a sorted AST with the same kind and spelling
+
+    @ivar last: The last record, the one diffs compare (see AstIndex.declarations)
+    @ivar count: The number of records
+    @ivar deprecated: Whether any of the records is a deprecated function
+    """
+
+    key: Tuple[str, str]
+    last: dict
+    count: int
+    deprecated: bool
+
+
+def _groups(records: Iterator[dict]) -> Iterator[_Group]:
+    # Only the last record of each group is kept, e.g. every instantiation of an
+    # export macro has the same kind and spelling
+    group = None
+    for record in records:
+        key = sortKey(record)
+        if group is not None and key == group.key:
+            group = _Group(
+                key,
+                record,
+                group.count + 1,
+                group.deprecated or bool(record.get("deprecated")),
+            )
+            continue
+        if group is not None:
+            yield group
+        group = _Group(key, record, 1, bool(record.get("deprecated")))
+    if group is not None:
+        yield group
+
+
+def _groupChanges(
+    kind: str, name: str, old: Optional[_Group], new: Optional[_Group]
+) -> Iterator[Change]:
+    if kind not in KNOWN_KINDS:
+        for _ in range(new.count if new else 0):
+            yield Change("unknown", kind, (name,))
+        return
+    if kind in ("MACRO_INSTANTIATION", "INCLUSION_DIRECTIVE"):
+        return
+    if old is None:
+        summary = _argumentsSummary(new.last) if kind == "FUNCTION_DECL" else None
+        yield Change("added", kind, (name,), new=summary)
+    elif new is None:
+        yield Change("removed", kind, (name,))
+    elif not _unchanged(old.last, new.last):
+        if kind == "FUNCTION_DECL":
+            yield from _functionChanges(name, old.last, new.last)
+            yield from _parameterChanges(name, old.last, new.last)
+        elif kind == "ENUM_DECL":
+            yield from _constantChanges(name, old.last, new.last)
+        elif kind == "STRUCT_DECL":
+            yield from _memberChanges(name, old.last, new.last)
+    if kind == "FUNCTION_DECL":
+        yield from _deprecationChange(
+            name, old is not None and old.deprecated, new is not None and new.deprecated
+        )
+
+
+def iterSortedChanges(
+    old_records: Iterable[dict], new_records: Iterable[dict]
+) -> Iterator[Change]:
+    """
+    Compares two ASTs read as streams of records sorted by sortKey, holding only one
+    record from each at a time
+
+    Finds the same changes as iterChanges, listed in the order of the declarations they
+    are in instead of grouped by kind of change. Deprecated functions are found from
+    their deprecated field, so ASTs converted before functions had one are not supported.
+    @param old_records: The records of the old AST, e.g. from readSortedNdjson
+    @param new_records: The records of the new AST
+    """
+    old_groups = _groups(iter(old_records))
+    new_groups = _groups(iter(new_records))
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.key < new.key):
+            yield from _groupChanges(*old.key, old, None)
+            old = next(old_groups, None)
+        elif old is None or new.key < old.key:
+            yield from _groupChanges(*new.key, None, new)
+            new = next(new_groups, None)
+        else:
+            yield from _groupChanges(*new.key, old, new)
+            old = next(old_groups, None)
+            new = next(new_groups, None)
+
+
+_ENTITY_NAMES = {
+    "FUNCTION_DECL": "function",
+    "TYPEDEF_DECL": "typedef",
+    "ENUM_DECL": "enum",
+    "VAR_DECL": "var",
+    "STRUCT_DECL": "struct",
+    "MACRO_DEFINITION": "macro",
+}
+
+_POINTER_FIELD_NAMES = {
+    "pointer_type": "pointer type",
+    "double_pointer_type": "double pointer type",
+}
+
+
+def formatChange(change: Change) -> str:
+    """
+    Formats a change as a human-readable line
+    """
+    c, kind, path, field, old, new = change
+    if c == "unknown":
+        return f"Unknown Kind Type: {kind}"
+    if kind == "FUNCTION_DECL":
+        if c == "added":
+            return f"New function: {path[0]} ({new})"
+        if c == "removed":
+            return f"Removed function: {path[0]}"
+        if field == "deprecated":
+            prefix = "New" if new else "Removed"
+            return f"{prefix} deprecated function: {path[0]}"
+        if field == "result_type":
+            return f"Changed return type in {path[0]} from {old} to {new}"
+        return f"Changed return {_POINTER_FIELD_NAMES[field]} in {path[0]} from {old} to {new}"
+    if kind == "PARM_DECL":
+        if c == "added":
+            return f"New parameter {path[1]} added to function {path[0]}"
+        if c == "removed":
+            return f"Removed parameter {path[1]} from function {path[0]}"
+        fieldName = _POINTER_FIELD_NAMES.get(field, field)
+        return (
+            f"Changed {fieldName} for param {path[1]} in {path[0]} from {old} to {new}"
+        )
+    if kind == "ENUM_CONSTANT_DECL":
+        if c == "added":
+            return f"New constant {path[1]}={new} in enum {path[0]}"
+        if c == "removed":
+            return f"Removed constant {path[1]} from enum {path[0]}"
+        return f"{field.capitalize()} of constant {path[1]} in enum {path[0]} changed from {old} to {new}"
+    if kind == "FIELD_DECL":
+        if c == "added":
+            return f"New field {path[1]} in struct {path[0]}"
+        if c == "removed":
+            return f"Removed field {path[1]} from struct {path[0]}"
+        return (
+            f"Type of field {path[1]} in struct {path[0]} changed from {old} to {new}"
+        )
+    prefix = "New" if c == "added" else "Removed"
+    return f"{prefix} {_ENTITY_NAMES[kind]}: {path[0]}"
+
+
+def firstChange(old_ast, new_ast) -> Optional[Change]:
+    """
+    Checks two ASTs for API changes, stopping at the first one found. ASTs with the same
+    fingerprint are not compared at all.
+    @param old_ast: The old AST, or an AstIndex of it
+    @param new_ast: The new AST, or an AstIndex of it
+    @return: The first change the diff would list, ignoring declarations of unknown
+        kinds, or None if there are no changes
+    """
+    if not isinstance(old_ast, AstIndex):
+        old_ast = AstIndex(old_ast)
+    if not isinstance(new_ast, AstIndex):
+        new_ast = AstIndex(new_ast)
+    if old_ast.fingerprint is not None and old_ast.fingerprint == new_ast.fingerprint:
+        return None
+    for change in iterChanges(old_ast, new_ast):
+        if change.change != "unknown":
+            return change
+    return None
+
+
+def diffAst(old_ast, new_ast):
+    for change in iterChanges(old_ast, new_ast):
+        print(formatChange(change))
@@ -10,52 +10,219 @@ import json
 import logging
 import os
 import sys
-from typing import List
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import clang.cindex as cidx
 
+from cheader2json.cursor_filter import CursorFilter
+from cheader2json.declarations import Declaration, asDict, newDeclaration
+from cheader2json.fingerprint import declarationFingerprint
+from cheader2json.parse_cache import ParseCache
+from cheader2json.preamble import PrecompiledPreamble
+from cheader2json.stats import ParseStats
+from cheader2json.traversal import fileCursors
+from cheader2json.type_cache import ResolvedType, TypeCache
+
+# Attribute macros that mark a function as deprecated unless others are given
+DEFAULT_DEPRECATION_MACROS = ["HELICS_DEPRECATED"]
+
+# Name of the synthetic source that includes every header in umbrella mode
+_UMBRELLA_SOURCE = "cheader2json_umbrella.h"
+
+# Holds the clang index of each thread, created lazily so each thread (and each
+# worker process) pays for it once instead of once per parser or header
+_threadState = threading.local()
+
+_logFormatter = logging.Formatter(
+    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+# The console handler of the module logger, attached by the first parser, and the number
+# of parsers currently writing debug logging to a log file
+_logStreamHandler = None
+_logFileCount = 0
+_logHandlersLock = threading.Lock()
+
+
+def _parseHeaderInWorker(
+    headerFile: str,
+    ignoredMacros: List[str],
+    args: List[str],
+    unsavedFiles: Optional[List[Tuple[str, bytes]]] = None,
+    cursorFilter: Optional[CursorFilter] = None,
+) -> Tuple[Tuple[list, dict, List[str]], ParseStats]:
+    """
+    Parses a single header file in a worker process
+    @param headerFile: The C header file to parse
+    @param ignoredMacros: A list of macros to ignore
+    @param args: Extra arguments passed to clang
+    @param unsavedFiles: (path, contents) of files that are read from memory instead of disk
+    @param cursorFilter: Selects the cursors and fields to extract
+    @return: The cursor info records, type map contributions and includes of the header,
+        and the stats collected while parsing it
+    """
+    # Skip the constructor, the worker only needs the cursor extraction helpers
+    parser = CHeaderParser.__new__(CHeaderParser)
+    parser.stats = ParseStats()
+    parser.cursorFilter = cursorFilter or CursorFilter()
+    result = parser._parseHeader(
+        parser._getIndex(), headerFile, ignoredMacros, args, unsavedFiles
+    )
+    return result, parser.stats
+
 
 class CHeaderParser(object):
     """
     Class that will parse C API headers and create other language bindings
 
-    @ivar parsedInfo: a dictionary with all the parsed cursors in the C API headers
+    All parse results are kept on the instance, so several parsers can be used at the
+    same time, each from a single thread (see ConversionPool).
 
-    """
+    @ivar parsedInfo: a dictionary with all the parsed cursors in the C API headers, as
+        Declaration objects that can be used as their records (see declarations.py)
+    @ivar stats: timings and counters collected while parsing the headers
 
-    _types = {}
+    """
 
-    def _configureLogger(self, logfilename="clangParserLog.log"):
+    def _configureLogger(self, logfilename: Optional[str] = None):
+        global _logStreamHandler
         self.clangLogger = logging.getLogger(__name__)
-        self.clangLogger.setLevel(logging.DEBUG)
-        logFormatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        clangLogFileHandler = logging.FileHandler(
-            logfilename, mode="w", encoding="utf-8"
+        self.logFile = logfilename
+        self._logFileHandler = None
+        self._logFileStarted = False
+        with _logHandlersLock:
+            if _logStreamHandler is None:
+                _logStreamHandler = logging.StreamHandler()
+                _logStreamHandler.setLevel(logging.INFO)
+                _logStreamHandler.setFormatter(_logFormatter)
+                self.clangLogger.addHandler(_logStreamHandler)
+            if _logFileCount == 0:
+                self.clangLogger.setLevel(logging.INFO)
+
+    @contextmanager
+    def _fileLogging(self):
+        """
+        Writes the logging of this parser, including debug records, to its log file while
+        in the context. The handler only takes records from the current thread, so other
+        parsers logging at the same time don't write to it.
+        """
+        global _logFileCount
+        if not self.logFile or self._logFileHandler is not None:
+            yield
+            return
+        handler = logging.FileHandler(
+            self.logFile, mode="a" if self._logFileStarted else "w", encoding="utf-8"
         )
-        clangLogStreamHandler = logging.StreamHandler()
-        clangLogFileHandler.setLevel(logging.DEBUG)
-        clangLogFileHandler.setFormatter(logFormatter)
-        clangLogStreamHandler.setLevel(logging.INFO)
-        clangLogStreamHandler.setFormatter(logFormatter)
-        self.clangLogger.addHandler(clangLogFileHandler)
-        self.clangLogger.addHandler(clangLogStreamHandler)
+        handler.setLevel(logging.DEBUG)
+        handler.setFormatter(_logFormatter)
+        thread = threading.get_ident()
+        handler.addFilter(lambda record: record.thread == thread)
+        self._logFileStarted = True
+        self._logFileHandler = handler
+        with _logHandlersLock:
+            _logFileCount += 1
+            self.clangLogger.addHandler(handler)
+            # Debug records are only produced while a log file is there to receive them
+            self.clangLogger.setLevel(logging.DEBUG)
+        try:
+            yield
+        finally:
+            with _logHandlersLock:
+                self.clangLogger.removeHandler(handler)
+                _logFileCount -= 1
+                if _logFileCount == 0:
+                    self.clangLogger.setLevel(logging.INFO)
+            handler.close()
+            self._logFileHandler = None
 
-    def __init__(self, headers: List[str], ignoredMacros: List[str]):
+    def __init__(
+        self,
+        headers: List[str],
+        ignoredMacros: List[str],
+        jobs: int = 1,
+        cacheDir: Optional[str] = None,
+        preambleHeaders: Optional[List[str]] = None,
+        pchDir: Optional[str] = None,
+        umbrella: bool = False,
+        parse: bool = True,
+        deprecationMacros: Optional[List[str]] = None,
+        annotationMacros: Optional[List[str]] = None,
+        unsavedFiles: Optional[List[Tuple[str, bytes]]] = None,
+        logFile: Optional[str] = None,
+        cursorFilter: Optional[CursorFilter] = None,
+    ):
         """
         Constructor
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @param jobs: Number of worker processes used to parse the headers
+        @param cacheDir: Directory used to cache the parse results of unchanged headers
+        @param preambleHeaders: Headers included by every header that are precompiled once and reused
+        @param pchDir: Directory the precompiled preamble is stored in so later runs can reuse it
+        @param umbrella: Parse all headers as a single translation unit that includes each of them
+        @param parse: Parse the headers right away, if False use iterCHeaderFiles() to stream the results
+        @param deprecationMacros: Attribute macros that mark a function as deprecated
+        @param annotationMacros: Other attribute macros recorded in the annotations of functions
+        @param unsavedFiles: (path, contents) of files that are read from memory instead of
+            disk, such as headers from a git revision. Preamble headers are always read from disk.
+        @param logFile: File that debug logging, including the full parse result, is written to
+        @param cursorFilter: Selects the top level cursors and the optional fields to extract.
+            Instantiations of the deprecation and annotation macros are always extracted
+            to annotate functions, even if they are filtered out or ignored.
         """
-        CHeaderParser._types["functions"] = {}
+        self._resetTypes()
         self.parsedInfo = {}
         self.headerFiles = headers
-        self._configureLogger()
-        for header in headers:
-            if not os.path.exists(header):
-                self.clangLogger.error(
-                    f"Invalid header file path: {header}. Please check the file path and ensure the file exists."
-                )
-        self.parseCHeaderFiles(headers, ignoredMacros)
+        self.jobs = jobs
+        self.cacheDir = cacheDir
+        self.preambleHeaders = preambleHeaders or []
+        self.pchDir = pchDir
+        self.umbrella = umbrella
+        self.deprecationMacros = (
+            DEFAULT_DEPRECATION_MACROS
+            if deprecationMacros is None
+            else deprecationMacros
+        )
+        self.annotationMacros = annotationMacros or []
+        self.unsavedFiles = unsavedFiles or []
+        self.cursorFilter = (cursorFilter or CursorFilter()).keeping(
+            set(self.deprecationMacros) | set(self.annotationMacros)
+        )
+        self.stats = ParseStats()
+        self._configureLogger(logFile)
+        unsavedPaths = {path for path, _ in self.unsavedFiles}
+        with self._fileLogging():
+            for header in headers:
+                if header not in unsavedPaths and not os.path.exists(header):
+                    self.clangLogger.error(
+                        f"Invalid header file path: {header}. Please check the file path and ensure the file exists."
+                    )
+        if parse:
+            self.parseCHeaderFiles(headers, ignoredMacros)
+
+    @property
+    def types(self) -> dict:
+        """
+        The types map: the names of the functions using each type, and the arguments of
+        each function under "functions"
+        """
+        return self._types
+
+    def _getIndex(self) -> cidx.Index:
+        """
+        Gets the clang index used to parse headers in the current thread, creating it on first use
+        """
+        index = getattr(_threadState, "index", None)
+        if index is None:
+            with self.stats.timed("index"):
+                index = _threadState.index = cidx.Index.create()
+        return index
 
     def _updateTypeFunctionMap(self, dataType: str, spelling: str):
         """
@@ -64,164 +231,158 @@ class CHeaderParser(object):
         if dataType and dataType != "":
             if spelling is None:
                 spelling = ""
-            if dataType not in CHeaderParser._types.keys():
-                CHeaderParser._types[dataType] = [spelling]
+            if dataType not in self._headerTypes.keys():
+                self._headerTypes[dataType] = [spelling]
             else:
-                CHeaderParser._types.get(dataType, []).append(spelling)
+                self._headerTypes.get(dataType, []).append(spelling)
 
-    def _addFunctionTypeInfo(self, node: cidx.Cursor, cursorInfoDict: dict):
+    def _resetTypes(self):
+        """
+        Empties the types map, before merging the type map contributions of the headers again
+        """
+        self._types = {"functions": {}}
+        # The spellings already listed for each type, so each is only listed once
+        self._typeSpellings = {}
+
+    def _mergeHeaderTypes(self, headerTypes: dict):
+        """
+        Merges the type map contributions of a single header into the types map
+        """
+        for dataType, value in headerTypes.items():
+            if dataType == "functions":
+                self._types["functions"].update(value)
+                continue
+            spellings = self._types.setdefault(dataType, [])
+            seen = self._typeSpellings.setdefault(dataType, set())
+            for spelling in value:
+                if spelling not in seen:
+                    seen.add(spelling)
+                    spellings.append(spelling)
+
+    def _addFunctionTypeInfo(
+        self, node: cidx.Cursor, info: Declaration, typePointee: ResolvedType
+    ):
         """
         Adds type information related to function arguments and return types
+        @param typePointee: The resolved result type of a function, or type of an argument
         """
         typeKey = ""
-        typePointee = None
         if node.kind == cidx.CursorKind.FUNCTION_DECL:
             typeKey = "result_type"
-            typePointee = node.result_type
         elif node.kind == cidx.CursorKind.PARM_DECL:
             typeKey = "type"
-            typePointee = node.type
 
-        pointer_depth, suffix, typeName = self._getPointerAndTypeInfo(typePointee)
+        pointer_depth = typePointee.pointerDepth
+        suffix = typePointee.pointerSuffix
+        typeName = typePointee.pointeeName
 
-        cursorInfoDict["pointer_depth"] = pointer_depth
-        cursorInfoDict["pointer_underlying_type"] = typeName
+        info.pointer_depth = pointer_depth
+        info.pointer_underlying_type = typeName
 
         if typePointee.kind == cidx.TypeKind.TYPEDEF:
-            cursorInfoDict[typeKey] = typeName
+            info[typeKey] = typeName
 
         if typePointee.kind == cidx.TypeKind.POINTER:
             if pointer_depth == 2:
-                cursorInfoDict[typeKey] = "Double Pointer"
-                cursorInfoDict["double_pointer_type"] = typeName + suffix
+                info[typeKey] = "Double Pointer"
+                info.double_pointer_type = sys.intern(typeName + suffix)
             else:
-                cursorInfoDict["pointer_type"] = typeName + suffix
-
-        self._updateTypeFunctionMap(
-            cursorInfoDict.get(typeKey, ""), cursorInfoDict.get("spelling", "")
-        )
-        self._updateTypeFunctionMap(
-            cursorInfoDict.get("pointer_type", ""), cursorInfoDict.get("spelling", "")
-        )
-        self._updateTypeFunctionMap(
-            cursorInfoDict.get("double_pointer_type", ""),
-            cursorInfoDict.get("spelling", ""),
-        )
+                info.pointer_type = sys.intern(typeName + suffix)
 
-    def _getPointerAndTypeInfo(self, typePointee: cidx.Type):
-        """
-        Gets type name and pointer related information for the given type
-        """
-        depth = 0
-        suffix = "_"
-        while typePointee.kind == cidx.TypeKind.POINTER:
-            depth += 1
-            suffix += "*"
-            typePointee = typePointee.get_pointee()
-        if typePointee.kind == cidx.TypeKind.ELABORATED:
-            typePointee = typePointee.get_named_type()
-        return (
-            depth,
-            suffix,
-            (
-                typePointee.get_typedef_name()
-                if typePointee.kind == cidx.TypeKind.TYPEDEF
-                else typePointee.kind.spelling
-            ),
-        )
+        self._updateTypeFunctionMap(info.get(typeKey, ""), info.spelling)
+        self._updateTypeFunctionMap(info.get("pointer_type", ""), info.spelling)
+        self._updateTypeFunctionMap(info.get("double_pointer_type", ""), info.spelling)
 
-    def _isTypeFunctionPointer(self, node: cidx.Cursor) -> bool:
+    def _isTypeFunctionPointer(
+        self, node: cidx.Cursor, nodeType: Optional[ResolvedType] = None
+    ) -> bool:
+        if nodeType is None:
+            nodeType = self._typeCache.resolve(node.type)
         if (
             node.kind == cidx.CursorKind.TYPEDEF_DECL
-            or node.type.kind == cidx.TypeKind.TYPEDEF
+            or nodeType.kind == cidx.TypeKind.TYPEDEF
         ):
-            if node.underlying_typedef_type.kind == cidx.TypeKind.POINTER:
-                type_pointee = node.underlying_typedef_type.get_pointee()
-                if type_pointee.kind == cidx.TypeKind.FUNCTIONPROTO:
-                    return True
-        elif node.type.kind == cidx.TypeKind.POINTER:
-            type_pointee = node.type.get_pointee()
-            if type_pointee.kind == cidx.TypeKind.FUNCTIONPROTO:
-                return True
-        return False
+            underlying = self._typeCache.resolve(node.underlying_typedef_type)
+            return underlying.functionPointerResult is not None
+        return nodeType.functionPointerResult is not None
 
     def _getFunctionPointerArguments(self, node: cidx.Cursor) -> list:
         # Returns a list of objects with info on function pointer arguments
         function_pointer_arguments = []
         for arg in node.get_children():
+            argType = self._typeCache.resolve(arg.type)
             arg_info = {
                 "name": arg.spelling,
-                "type": arg.type.spelling
-                if arg.kind != cidx.TypeKind.ELABORATED
-                else arg.get_named_type().spelling,
+                "type": argType.spelling,
             }
-            if self._isTypeFunctionPointer(arg):
+            if self._isTypeFunctionPointer(arg, argType):
                 arg_info["function_pointer_arguments"] = (
                     self._getFunctionPointerArguments(arg)
                 )
-                arg_info["function_pointer_result_type"] = (
-                    arg.type.get_pointee().get_result().spelling
-                )
+                arg_info["function_pointer_result_type"] = argType.functionPointerResult
             function_pointer_arguments.append(arg_info)
         return function_pointer_arguments
 
-    def _cursorInfo(self, node: cidx.Cursor) -> dict:
+    def _cursorInfo(self, node: cidx.Cursor) -> Declaration:
         """
         Helper function for parseCHeaderFiles()
         """
-        cursorInfoDict = {
-            "kind": node.kind.name,
-            "spelling": node.spelling,
-            "location": node.location.file.name,
-            "type": node.type.kind.spelling
-            if node.type.kind != cidx.TypeKind.ELABORATED
-            else node.type.get_named_type().spelling,
-            "result_type": node.result_type.kind.spelling
-            if node.result_type.kind != cidx.TypeKind.ELABORATED
-            else node.result_type.get_named_type().spelling,
-            "brief_comment": node.brief_comment,
-        }
-
-        cursor_range = node.extent
-        cursorInfoDict["start_line"] = cursor_range.start.line
-        cursorInfoDict["end_line"] = cursor_range.end.line
+        omitFields = self.cursorFilter.omitFields
+        nodeType = self._typeCache.resolve(node.type)
+        resultType = self._typeCache.resolve(node.result_type)
+        # Names and paths repeat across cursors, keep a single copy of each
+        info = newDeclaration(
+            node.kind.name,
+            sys.intern(node.spelling),
+            sys.intern(node.location.file.name),
+            nodeType.name,
+            resultType.name,
+        )
+        if "comments" not in omitFields:
+            info.brief_comment = node.brief_comment
+        self.stats.cursorKinds[info.kind] += 1
+
+        if "lines" not in omitFields:
+            cursor_range = node.extent
+            info.start_line = cursor_range.start.line
+            info.end_line = cursor_range.end.line
         if node.kind == cidx.CursorKind.FUNCTION_DECL:
-            cursorInfoDict["raw_comment"] = node.raw_comment
-            self._addFunctionTypeInfo(node, cursorInfoDict)
-            cursorInfoDict["arguments"] = {}
+            if "comments" not in omitFields:
+                info.raw_comment = node.raw_comment
+            self._addFunctionTypeInfo(node, info, resultType)
+            info.arguments = {}
             argNum = 0
             for arg in node.get_arguments():
-                cursorInfoDict["arguments"][argNum] = self._cursorInfo(arg)
+                info.arguments[argNum] = self._cursorInfo(arg)
                 argNum += 1
-            cursorInfoDict["argument_count"] = argNum
-            CHeaderParser._types["functions"][cursorInfoDict.get("spelling", "")] = (
-                cursorInfoDict["arguments"]
-            )
+            info.argument_count = argNum
+            self._headerTypes["functions"][info.spelling] = info.arguments
         if node.kind == cidx.CursorKind.PARM_DECL:
-            self._addFunctionTypeInfo(node, cursorInfoDict)
+            self._addFunctionTypeInfo(node, info, nodeType)
         if (
             node.kind == cidx.CursorKind.TYPEDEF_DECL
-            or node.type.kind == cidx.TypeKind.TYPEDEF
+            or nodeType.kind == cidx.TypeKind.TYPEDEF
         ):
-            cursorInfoDict["type"] = node.underlying_typedef_type.spelling
-            if cursorInfoDict["type"] == "":
-                cursorInfoDict["type"] = node.type.get_typedef_name()
-            if self._isTypeFunctionPointer(node):
-                cursorInfoDict["function_pointer_arguments"] = (
-                    self._getFunctionPointerArguments(node)
+            underlyingType = self._typeCache.resolve(node.underlying_typedef_type)
+            info.type = underlyingType.spelling
+            if info.type == "":
+                info.type = node.type.get_typedef_name()
+            if underlyingType.functionPointerResult is not None:
+                info["function_pointer_arguments"] = self._getFunctionPointerArguments(
+                    node
                 )
-                cursorInfoDict["function_pointer_result_type"] = (
-                    node.underlying_typedef_type.get_pointee().get_result().spelling
+                info["function_pointer_result_type"] = (
+                    underlyingType.functionPointerResult
                 )
         if node.kind == cidx.CursorKind.ENUM_DECL:
-            cursorInfoDict["enumerations"] = {}
+            info.enumerations = {}
             enumNum = 0
             for i in node.get_children():
-                cursorInfoDict["enumerations"][enumNum] = self._cursorInfo(i)
+                info.enumerations[enumNum] = self._cursorInfo(i)
                 enumNum += 1
         if node.kind == cidx.CursorKind.ENUM_CONSTANT_DECL:
-            cursorInfoDict["value"] = node.enum_value
-        if node.kind == cidx.CursorKind.VAR_DECL:
+            info.value = node.enum_value
+        if node.kind == cidx.CursorKind.VAR_DECL and "values" not in omitFields:
             tokens = []
             for t in node.get_tokens():
                 tokens.append(t.spelling)
@@ -230,69 +391,418 @@ class CHeaderParser(object):
             else:
                 value = tokens[len(tokens) - 1]
             try:
-                cursorInfoDict["value"] = json.loads(value)
+                info.value = json.loads(value)
             except json.decoder.JSONDecodeError:
-                cursorInfoDict["value"] = value
+                info.value = value
         if node.kind == cidx.CursorKind.STRUCT_DECL:
-            cursorInfoDict["members"] = {}
+            info.members = {}
             memberNum = 0
             for i in node.get_children():
-                cursorInfoDict["members"][memberNum] = self._cursorInfo(i)
+                info.members[memberNum] = self._cursorInfo(i)
                 memberNum += 1
-        if node.kind == cidx.CursorKind.MACRO_DEFINITION:
+        if node.kind == cidx.CursorKind.MACRO_DEFINITION and "values" not in omitFields:
             value = ""
             for t in node.get_tokens():
                 value = t.spelling
             try:
-                cursorInfoDict["value"] = json.loads(value)
+                info.value = json.loads(value)
             except json.decoder.JSONDecodeError:
-                cursorInfoDict["value"] = value
-        return cursorInfoDict
+                info.value = value
+        return info
 
-    def parseCHeaderFiles(self, headers: List[str], ignoredMacros: List[str]) -> None:
+    def _parseHeader(
+        self,
+        idx: cidx.Index,
+        headerFile: str,
+        ignoredMacros: List[str],
+        args: Optional[List[str]] = None,
+        unsavedFiles: Optional[List[Tuple[str, bytes]]] = None,
+    ) -> Tuple[list, dict, List[str]]:
         """
-        Function that parses the C header files
-        @param headers: A list of the C header files to parse
+        Parses a single C header file
+        @param idx: The clang index used to parse the header
+        @param headerFile: The C header file to parse
         @param ignoredMacros: A list of macros to ignore
+        @param args: Extra arguments passed to clang
+        @param unsavedFiles: (path, contents) of files that are read from memory instead of disk
+        @return: The cursor info records, type map contributions and includes of the header
         """
-        idx = cidx.Index.create()
-        cursorNum = 0
-        for headerFile in headers:
-            try:
+        try:
+            with self.stats.timed("parse", headerFile):
                 tu = idx.parse(
                     headerFile,
+                    args=args,
+                    unsaved_files=unsavedFiles,
                     options=cidx.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
                 )
-            except cidx.TranslationUnitLoadError as e:
-                raise Exception(f"Error parsing {headerFile}") from e
-            for c in tu.cursor.get_children():
-                if c.location.file is not None:
+        except cidx.TranslationUnitLoadError as e:
+            raise Exception(f"Error parsing {headerFile}") from e
+        self.stats.countDiagnostics(headerFile, tu.diagnostics)
+        return self._extractHeader(tu, headerFile, ignoredMacros)
+
+    def _extractHeader(
+        self, tu: cidx.TranslationUnit, headerFile: str, ignoredMacros: List[str]
+    ) -> Tuple[list, dict, List[str]]:
+        """
+        Extracts the top level cursors of a header from its translation unit
+        @param tu: The parsed translation unit of the header
+        @param headerFile: The C header file that was parsed
+        @param ignoredMacros: A list of macros to ignore
+        @return: The cursor info records, type map contributions and includes of the header
+        """
+        self._headerTypes = {"functions": {}}
+        self._typeCache = TypeCache()
+        records = []
+        cursorFilter = self.cursorFilter
+        with self.stats.timed("walk", headerFile):
+            for c, _ in fileCursors(
+                tu, {headerFile: headerFile}, cursorFilter.wantsKind
+            ):
+                # Ignored attribute macros are dropped after annotating functions
+                if cursorFilter.wantsName(c) and (
+                    c.displayname not in ignoredMacros or cursorFilter.keepsMacro(c)
+                ):
+                    records.append(self._cursorInfo(c))
+        self._countTypeCache()
+        includes = sorted({inc.include.name for inc in tu.get_includes()})
+        return records, self._headerTypes, includes
+
+    def _countTypeCache(self):
+        """
+        Adds the hits and misses of the type cache of the last translation unit to the stats
+        """
+        self.stats.counters["type_cache_hits"] += self._typeCache.hits
+        self.stats.counters["type_cache_misses"] += self._typeCache.misses
+
+    def _renameLocation(self, cursorInfoDict: Declaration, oldName: str, newName: str):
+        """
+        Replaces the file name of a cursor and its children, so locations are spelled
+        the same way as the header file paths that were requested
+        """
+        if cursorInfoDict.get("location") == oldName:
+            cursorInfoDict["location"] = newName
+        for childrenKey in ("arguments", "enumerations", "members"):
+            for child in cursorInfoDict.get(childrenKey, {}).values():
+                self._renameLocation(child, oldName, newName)
+
+    def _parseUmbrella(
+        self,
+        idx: cidx.Index,
+        headers: List[str],
+        ignoredMacros: List[str],
+        args: Optional[List[str]] = None,
+        unsavedFiles: Optional[List[Tuple[str, bytes]]] = None,
+    ) -> List[Tuple[list, dict, List[str]]]:
+        """
+        Parses the C header files as one translation unit, so headers included by other
+        requested headers are only parsed once
+        @param idx: The clang index used to parse the headers
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @param args: Extra arguments passed to clang
+        @param unsavedFiles: (path, contents) of files that are read from memory instead of disk
+        @return: The cursor info records, type map contributions and includes of each header
+        """
+        # A header given more than once is only included once, each occurrence gets a copy
+        # of its results below, the same as parsing it once per occurrence
+        uniqueHeaders = list(dict.fromkeys(headers))
+        source = "".join(f'#include "{h}"\n' for h in uniqueHeaders)
+        try:
+            with self.stats.timed("parse", _UMBRELLA_SOURCE):
+                tu = idx.parse(
+                    _UMBRELLA_SOURCE,
+                    args=args,
+                    unsaved_files=[(_UMBRELLA_SOURCE, source)]
+                    + list(unsavedFiles or []),
+                    options=cidx.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+                )
+        except cidx.TranslationUnitLoadError as e:
+            raise Exception(f"Error parsing {headers}") from e
+        self.stats.countDiagnostics(_UMBRELLA_SOURCE, tu.diagnostics)
+        walkStart = time.perf_counter()
+        owners = {h: i for i, h in enumerate(uniqueHeaders)}
+        records = [[] for _ in uniqueHeaders]
+        headerTypes = [{"functions": {}} for _ in uniqueHeaders]
+        seen = set()
+        self._typeCache = TypeCache()
+        for c, owner in fileCursors(tu, owners, self.cursorFilter.wantsKind):
+            if not self.cursorFilter.wantsName(c) or (
+                c.displayname in ignoredMacros and not self.cursorFilter.keepsMacro(c)
+            ):
+                continue
+            # Headers without include guards are expanded once per include, keep the first
+            position = (owner, c.extent.start.offset, c.kind)
+            if position in seen:
+                continue
+            seen.add(position)
+            self._headerTypes = headerTypes[owner]
+            info = self._cursorInfo(c)
+            if info["location"] != uniqueHeaders[owner]:
+                self._renameLocation(info, info["location"], uniqueHeaders[owner])
+            records[owner].append(info)
+        self.stats.addTime("walk", time.perf_counter() - walkStart, _UMBRELLA_SOURCE)
+        self._countTypeCache()
+        includes = sorted({inc.include.name for inc in tu.get_includes()})
+        results = []
+        returned = set()
+        for h in headers:
+            owner = owners[h]
+            headerRecords = records[owner]
+            if owner in returned:
+                # Records are modified while finishing them, so repeats get shallow copies
+                headerRecords = [r.copy() for r in headerRecords]
+            returned.add(owner)
+            results.append((headerRecords, headerTypes[owner], includes))
+        return results
+
+    def _mergeAnonymousDeclarations(self, headerInfo: dict) -> None:
+        """
+        Names anonymous declarations after the declaration with the same extent, such as
+        the typedef in `typedef enum {...} name;`, and drops that duplicate declaration
+        @param headerInfo: The records parsed from a single header, by parsedInfo key
+        """
+        extentIndex = {}
+        for key, info in headerInfo.items():
+            extent = (info["location"], info["start_line"], info["end_line"])
+            extentIndex.setdefault(extent, []).append(key)
+        deletekeys = []
+        for key, info in headerInfo.items():
+            if info["spelling"] == "":
+                extent = (info["location"], info["start_line"], info["end_line"])
+                for i in extentIndex[extent]:
+                    if i != key:
+                        info["spelling"] = headerInfo[i]["spelling"]
+                        deletekeys.append(i)
+        for key in deletekeys:
+            headerInfo.pop(key, None)
+
+    def _annotateFunctions(self, headerInfo: dict, records: Iterable[dict]) -> None:
+        """
+        Records the attribute macros used on each function, and whether any of them
+        mark the function as deprecated
+        @param headerInfo: The records parsed from a single header, by parsedInfo key
+        @param records: The records to look for attribute macro instantiations in, in
+            source order, including those of ignored macros that are not in headerInfo
+        """
+        attributeMacros = set(self.deprecationMacros) | set(self.annotationMacros)
+        lineMacros = {}
+        for info in records:
+            if (
+                info["kind"] == "MACRO_INSTANTIATION"
+                and info["spelling"] in attributeMacros
+            ):
+                line = (info["location"], info["start_line"])
+                lineMacros.setdefault(line, []).append(info["spelling"])
+        for info in headerInfo.values():
+            if info["kind"] == "FUNCTION_DECL":
+                annotations = lineMacros.get((info["location"], info["start_line"]), [])
+                info["deprecated"] = any(
+                    m in self.deprecationMacros for m in annotations
+                )
+                info["annotations"] = list(annotations)
+
+    def _parseHeaders(
+        self,
+        headers: List[str],
+        ignoredMacros: List[str],
+        preamble: Optional[PrecompiledPreamble] = None,
+    ) -> Iterator[Tuple[list, dict, List[str]]]:
+        """
+        Parses the given C header files, in worker processes if more than one job is used
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @param preamble: Precompiled preamble to parse the headers with
+        @return: The cursor info records, type map contributions and includes of each header
+        """
+        if preamble:
+            with self.stats.timed("preamble"):
+                preamble.build(self._getIndex())
+        headerArgs = [preamble.argsFor(h) if preamble else [] for h in headers]
+        pool = None
+        if self.umbrella and len(headers) > 1:
+            # The precompiled preamble can only be used if it hides none of the headers
+            args = headerArgs[0] if all(headerArgs) else []
+            headerArgs = [args for _ in headers]
+            parsed = iter(
+                self._parseUmbrella(
+                    self._getIndex(), headers, ignoredMacros, args, self.unsavedFiles
+                )
+            )
+        elif self.jobs > 1 and len(headers) > 1:
+            # Each worker process parses with its own index, results come back in header order
+            pool = ProcessPoolExecutor(max_workers=min(self.jobs, len(headers)))
+            parsed = (
+                self._mergeWorkerStats(*result)
+                for result in pool.map(
+                    _parseHeaderInWorker,
+                    headers,
+                    repeat(ignoredMacros),
+                    headerArgs,
+                    repeat(self.unsavedFiles),
+                    repeat(self.cursorFilter),
+                )
+            )
+        else:
+            parsed = (
+                self._parseHeader(
+                    self._getIndex(), headerFile, ignoredMacros, args, self.unsavedFiles
+                )
+                for headerFile, args in zip(headers, headerArgs)
+            )
+        try:
+            for (records, headerTypes, includes), args in zip(parsed, headerArgs):
+                if preamble and args:
+                    # Files pulled in through the PCH are not reported as includes of the header
+                    includes = sorted(set(includes) | set(preamble.includes))
+                yield records, headerTypes, includes
+        finally:
+            if pool:
+                pool.shutdown()
+
+    def _mergeWorkerStats(
+        self, result: Tuple[list, dict, List[str]], stats: ParseStats
+    ) -> Tuple[list, dict, List[str]]:
+        self.stats.merge(stats)
+        return result
+
+    def _loadCached(
+        self, cache: Optional[ParseCache], headerFile: str
+    ) -> Optional[Tuple[list, dict]]:
+        if cache is None:
+            return None
+        with self.stats.timed("cache", headerFile):
+            return cache.load(headerFile)
+
+    def _iterHeaderResults(
+        self, headers: List[str], ignoredMacros: List[str]
+    ) -> Iterator[Tuple[list, dict]]:
+        """
+        Gets the parse results of each header, in order, from the cache or by parsing it
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @return: The cursor info records and type map contributions of each header
+        """
+        cache = None
+        if self.cacheDir:
+            cache = ParseCache(
+                self.cacheDir,
+                ignoredMacros,
+                self.unsavedFiles,
+                self.cursorFilter.cacheKey(),
+                self.clangLogger,
+            )
+        cacheHits = 0
+        with tempfile.TemporaryDirectory() as tmpDir:
+            preamble = None
+            if self.preambleHeaders:
+                preamble = PrecompiledPreamble(
+                    self.pchDir or tmpDir, self.preambleHeaders, self.clangLogger
+                )
+            if self.umbrella or self.jobs > 1:
+                # All headers that need parsing are handed off at once
+                results = [self._loadCached(cache, h) for h in headers]
+                toParse = [h for h, result in zip(headers, results) if result is None]
+                cacheHits = len(headers) - len(toParse)
+                parsed = self._parseHeaders(toParse, ignoredMacros, preamble)
+            else:
+                # Parse one header at a time, so its results can be consumed before the next
+                results = (self._loadCached(cache, h) for h in headers)
+                parsed = None
+            for headerFile, result in zip(headers, results):
+                if result is None:
+                    records, headerTypes, includes = next(
+                        parsed
+                        or self._parseHeaders([headerFile], ignoredMacros, preamble)
+                    )
+                    if cache:
+                        with self.stats.timed("cache", headerFile):
+                            cache.store(headerFile, records, headerTypes, includes)
+                    result = (records, headerTypes)
+                elif parsed is None:
+                    cacheHits += 1
+                yield result
+        if cache:
+            self.clangLogger.info(
+                f"{cacheHits} of {len(headers)} headers loaded from cache"
+            )
+
+    def _finishHeaders(
+        self, results: Iterable[Tuple[list, dict]], ignoredMacros: List[str]
+    ) -> Iterator[Tuple[int, dict]]:
+        """
+        Merges the parse results of each header into the types map and numbers and
+        fingerprints their records, after merging anonymous declarations and annotating
+        functions. Without line ranges neither can be done, so both are skipped.
+        @param results: The cursor info records and type map contributions of each header
+        @param ignoredMacros: A list of macros to ignore, instantiations of ignored
+            attribute macros are only used to annotate functions
+        @return: The parsedInfo key and cursor info record of each top level cursor
+        """
+        cursorNum = 0
+        for records, headerTypes in results:
+            with self.stats.timed("merge"):
+                self._mergeHeaderTypes(headerTypes)
+                headerInfo = {}
+                ignoredAttributes = []
+                for record in records:
                     if (
-                        c.location.file.name == headerFile
-                        and c.displayname not in ignoredMacros
+                        record["kind"] == "MACRO_INSTANTIATION"
+                        and record["spelling"] in ignoredMacros
                     ):
-                        self.parsedInfo[cursorNum] = self._cursorInfo(c)
-                        cursorNum += 1
-            deletekeys = []
-            for key in self.parsedInfo.keys():
-                if self.parsedInfo[key]["spelling"] == "":
-                    for i in self.parsedInfo.keys():
-                        if i != key:
-                            if (
-                                self.parsedInfo[key]["start_line"]
-                                == self.parsedInfo[i]["start_line"]
-                                and self.parsedInfo[key]["end_line"]
-                                == self.parsedInfo[i]["end_line"]
-                            ):
-                                self.parsedInfo[key]["spelling"] = self.parsedInfo[i][
-                                    "spelling"
-                                ]
-                                deletekeys.append(i)
-            for key in deletekeys:
-                del self.parsedInfo[key]
-        self.clangLogger.info("Clang successfully parsed the C header files!")
-        self.clangLogger.debug(
-            f"The clang parser result:\n"
-            f"{json.dumps(self.parsedInfo, indent=4, sort_keys=True)}\n"
-            f"{json.dumps(CHeaderParser._types, indent=4, sort_keys=True)}"
-        )
+                        ignoredAttributes.append(record)
+                        continue
+                    headerInfo[cursorNum] = record
+                    cursorNum += 1
+                if "lines" not in self.cursorFilter.omitFields:
+                    self._mergeAnonymousDeclarations(headerInfo)
+                    annotating = {id(r) for r in headerInfo.values()}
+                    annotating.update(id(r) for r in ignoredAttributes)
+                    self._annotateFunctions(
+                        headerInfo, [r for r in records if id(r) in annotating]
+                    )
+                if self.cursorFilter.active:
+                    # Drop the macro instantiations only extracted to annotate functions
+                    for key in [
+                        k
+                        for k, info in headerInfo.items()
+                        if not self.cursorFilter.accepts(info)
+                    ]:
+                        del headerInfo[key]
+                for record in headerInfo.values():
+                    record["fingerprint"] = declarationFingerprint(record)
+            yield from headerInfo.items()
+
+    def iterCHeaderFiles(
+        self, headers: List[str], ignoredMacros: List[str]
+    ) -> Iterator[Tuple[int, dict]]:
+        """
+        Function that parses the C header files, yielding the finished top level records
+        of each header as soon as that header has been parsed
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @return: The parsedInfo key and cursor info record of each top level cursor
+        """
+        with self._fileLogging():
+            yield from self._finishHeaders(
+                self._iterHeaderResults(headers, ignoredMacros), ignoredMacros
+            )
+            self.clangLogger.info("Clang successfully parsed the C header files!")
+
+    def parseCHeaderFiles(self, headers: List[str], ignoredMacros: List[str]) -> None:
+        """
+        Function that parses the C header files
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        """
+        with self._fileLogging():
+            for key, record in self.iterCHeaderFiles(headers, ignoredMacros):
+                self.parsedInfo[key] = record
+            # Dumping the whole result is expensive, only do it for the log file
+            if self.logFile:
+                self.clangLogger.debug(
+                    "The clang parser result:\n%s\n%s",
+                    json.dumps(
+                        self.parsedInfo, indent=4, sort_keys=True, default=asDict
+                    ),
+                    json.dumps(self._types, indent=4, sort_keys=True, default=asDict),
+                )
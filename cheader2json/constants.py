@@ -0,0 +1,22 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Choices of the command line options. This module imports nothing, so the CLI can build
+its options without importing the modules that read and write the files.
+"""
+
+# Output formats of the ast file, used as the file extension
+AST_FORMATS = ["json", "ndjson", "bin"]
+
+# Schemas of the output files, version 1 has children and records keyed by position
+SCHEMAS = ["v1", "v2"]
+
+# Fields of the cursor info records that can be left out:
+#   comments  brief_comment and raw_comment
+#   values    values of variables and macros, which are read from their tokens
+#   lines     start_line and end_line
+OPTIONAL_FIELDS = ["comments", "values", "lines"]
@@ -0,0 +1,79 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from cheader2json.cheader_reader import CHeaderParser
+
+
+class ConversionPool(object):
+    """
+    Runs independent header conversions concurrently on a pool of threads
+
+    Each conversion gets its own CHeaderParser, so conversions share no results, and
+    each thread parses with its own clang index. libclang runs without holding the
+    GIL, so parsing scales with the number of threads while walking the cursors is
+    still serialized by the GIL. Use it as a context manager, or call shutdown().
+
+    Example:
+        with ConversionPool(maxWorkers=4) as pool:
+            futures = [pool.submit([header], []) for header in headers]
+            for future in futures:
+                parser = future.result()
+                print(len(parser.parsedInfo), len(parser.types))
+    """
+
+    def __init__(self, maxWorkers: Optional[int] = None):
+        """
+        Constructor
+        @param maxWorkers: Number of threads, the ThreadPoolExecutor default if not given
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix="cheader2json"
+        )
+
+    @staticmethod
+    def _convert(headers: List[str], ignoredMacros: List[str], options: dict):
+        return CHeaderParser(headers, ignoredMacros, **options)
+
+    def submit(
+        self, headers: List[str], ignoredMacros: List[str], **options
+    ) -> "Future[CHeaderParser]":
+        """
+        Schedules the conversion of a set of headers
+        @param headers: A list of the C header files to parse
+        @param ignoredMacros: A list of macros to ignore
+        @param options: Other keyword arguments of the CHeaderParser constructor
+        @return: A future of the parser, with the results in parsedInfo, types and stats
+        """
+        return self._executor.submit(self._convert, headers, ignoredMacros, options)
+
+    def map(
+        self, conversions: Iterable[Tuple[List[str], List[str]]], **options
+    ) -> Iterator[CHeaderParser]:
+        """
+        Converts several sets of headers concurrently
+        @param conversions: The headers and ignored macros of each conversion
+        @param options: Other keyword arguments of the CHeaderParser constructor, used for every conversion
+        @return: The parser of each conversion, in the order the conversions were given
+        """
+        futures = [
+            self.submit(headers, ignoredMacros, **options)
+            for headers, ignoredMacros in conversions
+        ]
+        return (future.result() for future in futures)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import copy
+import re
+from typing import Iterable, List, Optional
+
+import clang.cindex as cidx
+
+from cheader2json.constants import OPTIONAL_FIELDS
+
+
+def _kindId(name: str) -> int:
+    kind = getattr(cidx.CursorKind, name, None)
+    if not isinstance(kind, cidx.CursorKind):
+        raise ValueError(f"Unknown cursor kind {name}")
+    return kind.value
+
+
+class CursorFilter(object):
+    """
+    Selects the top level cursors to extract and the optional fields to extract for them
+
+    Checks are ordered from cheapest to most expensive, the kind is checked before the
+    cursor location is looked up and names are checked before any other info is read.
+    Macro instantiations of the attribute macros in keepMacros are always extracted, even
+    when they are ignored, so functions can be annotated, and dropped afterwards if the
+    filter excludes them.
+    """
+
+    def __init__(
+        self,
+        includeKinds: Optional[Iterable[str]] = None,
+        excludeKinds: Optional[Iterable[str]] = None,
+        includeNames: Optional[Iterable[str]] = None,
+        excludeNames: Optional[Iterable[str]] = None,
+        omitFields: Optional[Iterable[str]] = None,
+        keepMacros: Optional[Iterable[str]] = None,
+    ):
+        """
+        Constructor
+        @param includeKinds: Cursor kind names to extract, every kind if not given
+        @param excludeKinds: Cursor kind names to skip
+        @param includeNames: Regular expressions, only cursors with a spelling matching one of them are extracted
+        @param excludeNames: Regular expressions, cursors with a spelling matching any of them are skipped
+        @param omitFields: Optional fields (see OPTIONAL_FIELDS) to leave out of the records
+        @param keepMacros: Attribute macros whose instantiations are needed to annotate functions
+        """
+        self.includeKinds = sorted(includeKinds or [])
+        self.excludeKinds = sorted(excludeKinds or [])
+        self.includeNames = list(includeNames or [])
+        self.excludeNames = list(excludeNames or [])
+        self.omitFields = set(omitFields or [])
+        for field in self.omitFields:
+            if field not in OPTIONAL_FIELDS:
+                raise ValueError(f"Unknown optional field {field}")
+        self.keepMacros = set(keepMacros or [])
+        self._includeKindIds = (
+            {_kindId(k) for k in self.includeKinds} if self.includeKinds else None
+        )
+        self._excludeKindIds = {_kindId(k) for k in self.excludeKinds}
+        self._includePatterns = [re.compile(p) for p in self.includeNames]
+        self._excludePatterns = [re.compile(p) for p in self.excludeNames]
+        self.active = bool(
+            self.includeKinds
+            or self.excludeKinds
+            or self.includeNames
+            or self.excludeNames
+        )
+
+    def cacheKey(self) -> List[str]:
+        """
+        Gets the settings that change the extracted records, for keying cached results
+        """
+        return (
+            [f"include-kind={k}" for k in self.includeKinds]
+            + [f"exclude-kind={k}" for k in self.excludeKinds]
+            + [f"include-name={p}" for p in self.includeNames]
+            + [f"exclude-name={p}" for p in self.excludeNames]
+            + [f"omit={f}" for f in sorted(self.omitFields)]
+            + [f"keep={m}" for m in sorted(self.keepMacros)]
+        )
+
+    def keeping(self, macros: Iterable[str]) -> "CursorFilter":
+        """
+        Gets a copy of the filter that also keeps the instantiations of some attribute macros
+        """
+        keeping = copy.copy(self)
+        keeping.keepMacros = self.keepMacros | set(macros)
+        return keeping
+
+    def keepsMacro(self, node: cidx.Cursor) -> bool:
+        """
+        Checks if a cursor is an instantiation of one of the macros in keepMacros
+        """
+        return (
+            node._kind_id == cidx.CursorKind.MACRO_INSTANTIATION.value
+            and node.spelling in self.keepMacros
+        )
+
+    def _acceptsKindId(self, kindId: int) -> bool:
+        if self._includeKindIds is not None and kindId not in self._includeKindIds:
+            return False
+        return kindId not in self._excludeKindIds
+
+    def _acceptsName(self, spelling: str) -> bool:
+        if self._includePatterns and not any(
+            p.search(spelling) for p in self._includePatterns
+        ):
+            return False
+        return not any(p.search(spelling) for p in self._excludePatterns)
+
+    def wantsKind(self, node: cidx.Cursor) -> bool:
+        """
+        Checks if a cursor may need to be extracted based on its kind alone, which needs
+        no calls into libclang
+        """
+        if not self.active:
+            return True
+        if self._acceptsKindId(node._kind_id):
+            return True
+        return (
+            bool(self.keepMacros)
+            and node._kind_id == cidx.CursorKind.MACRO_INSTANTIATION.value
+        )
+
+    def wantsName(self, node: cidx.Cursor) -> bool:
+        """
+        Checks if a cursor that passed wantsKind() needs to be extracted based on its spelling
+        """
+        if not self.active:
+            return True
+        if self._acceptsKindId(node._kind_id) and self._acceptsName(node.spelling):
+            return True
+        return self.keepsMacro(node)
+
+    def accepts(self, cursorInfoDict: dict) -> bool:
+        """
+        Checks if an extracted top level record is selected by the filter
+        """
+        if not self.active:
+            return True
+        return self._acceptsKindId(
+            getattr(cidx.CursorKind, cursorInfoDict["kind"]).value
+        ) and self._acceptsName(cursorInfoDict["spelling"] or "")
@@ -0,0 +1,274 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import copy
+from collections.abc import MutableMapping
+from operator import attrgetter
+from typing import ItemsView, Iterator, KeysView, ValuesView
+
+from cheader2json.schema_v2 import CHILDREN_FIELDS
+
+# Fields of every declaration, in the order they are written, starting with the
+# fields set when it is created
+_REQUIRED_FIELDS = ("kind", "spelling", "location", "type", "result_type")
+_COMMON_FIELDS = _REQUIRED_FIELDS + (
+    "brief_comment",
+    "start_line",
+    "end_line",
+)
+_POINTER_FIELDS = (
+    "pointer_depth",
+    "pointer_underlying_type",
+    "double_pointer_type",
+    "pointer_type",
+)
+_FUNCTION_POINTER_FIELDS = (
+    "function_pointer_arguments",
+    "function_pointer_result_type",
+)
+
+
+class _Missing(object):
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self) -> str:
+        return "MISSING"
+
+
+# Value of the fields of a declaration that are not set
+MISSING = _Missing()
+
+
+class Declaration(MutableMapping):
+    """
+    A declaration extracted from a cursor, the record of a top level cursor or of one
+    of its children
+
+    Fields are stored in slots instead of a dict per cursor. Fields that are not set
+    hold MISSING, and are missing from the record the same as keys missing from a
+    record dict. A declaration can be used in place of its record dict, reading and
+    writing fields by their json keys, and toDict() converts it to the record dict
+    written to json, with its keys in the same order. Fields that the kind of
+    declaration does not have are kept in a dict. Declarations of kinds without a
+    subclass only have the common fields.
+    """
+
+    # Json keys of the fields, in the order they are written
+    FIELDS = _COMMON_FIELDS + ("fingerprint",)
+    __slots__ = FIELDS + ("_extra",)
+
+    def __init__(
+        self, kind: str, spelling: str, location: str, type: str, result_type: str
+    ):
+        self.kind = kind
+        self.spelling = spelling
+        self.location = location
+        self.type = type
+        self.result_type = result_type
+        for field in self._optionalFields:
+            setattr(self, field, MISSING)
+        self._extra = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _setFieldInfo(cls)
+
+    def __getstate__(self) -> dict:
+        return self._fields()
+
+    def __setstate__(self, state: dict):
+        for field in self.FIELDS:
+            setattr(self, field, MISSING)
+        self._extra = None
+        for key, value in state.items():
+            self[key] = value
+
+    def __getitem__(self, key: str):
+        if key in self._fieldSet:
+            value = getattr(self, key)
+            if value is MISSING:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value):
+        if key in self._fieldSet:
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self._fieldSet:
+            if getattr(self, key) is MISSING:
+                raise KeyError(key)
+            setattr(self, key, MISSING)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key) -> bool:
+        if key in self._fieldSet:
+            return getattr(self, key) is not MISSING
+        return self._extra is not None and key in self._extra
+
+    def _fields(self) -> dict:
+        fields = {
+            field: value
+            for field, value in zip(self.FIELDS, self._values(self))
+            if value is not MISSING
+        }
+        if self._extra:
+            fields.update(self._extra)
+        return fields
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields())
+
+    def __len__(self) -> int:
+        return len(self._fields())
+
+    # Views of the fields that are set, in the order they are written
+    def keys(self) -> KeysView:
+        return self._fields().keys()
+
+    def items(self) -> ItemsView:
+        return self._fields().items()
+
+    def values(self) -> ValuesView:
+        return self._fields().values()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.toDict()!r})"
+
+    def get(self, key: str, default=None):
+        if key in self._fieldSet:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def copy(self) -> "Declaration":
+        """
+        Makes a shallow copy, sharing the children and other mutable fields
+        """
+        return copy.copy(self)
+
+    def toDict(self) -> dict:
+        """
+        Converts the declaration and its children to record dicts
+        """
+        record = self._fields()
+        for field in self._childrenFields:
+            children = record.get(field)
+            if children is not None:
+                record[field] = {key: child.toDict() for key, child in children.items()}
+        return record
+
+
+def _setFieldInfo(cls):
+    cls._fieldSet = frozenset(cls.FIELDS)
+    cls._optionalFields = cls.FIELDS[len(_REQUIRED_FIELDS) :]
+    cls._childrenFields = tuple(f for f in CHILDREN_FIELDS if f in cls._fieldSet)
+    # Reads the values of all fields at once, in order
+    cls._values = staticmethod(attrgetter(*cls.FIELDS))
+
+
+_setFieldInfo(Declaration)
+
+
+class Function(Declaration):
+    FIELDS = (
+        _COMMON_FIELDS
+        + ("raw_comment",)
+        + _POINTER_FIELDS
+        + ("arguments", "argument_count")
+        + _FUNCTION_POINTER_FIELDS
+        + ("deprecated", "annotations", "fingerprint")
+    )
+    __slots__ = tuple(f for f in FIELDS if f not in Declaration.FIELDS)
+
+
+class Parameter(Declaration):
+    FIELDS = _COMMON_FIELDS + _POINTER_FIELDS + _FUNCTION_POINTER_FIELDS
+    __slots__ = tuple(f for f in FIELDS if f not in Declaration.FIELDS)
+
+
+class Enum(Declaration):
+    FIELDS = _COMMON_FIELDS + ("enumerations", "fingerprint")
+    __slots__ = ("enumerations",)
+
+
+class EnumConstant(Declaration):
+    FIELDS = _COMMON_FIELDS + ("value",)
+    __slots__ = ("value",)
+
+
+class Struct(Declaration):
+    FIELDS = _COMMON_FIELDS + ("members", "fingerprint")
+    __slots__ = ("members",)
+
+
+class Field(Declaration):
+    FIELDS = _COMMON_FIELDS + _FUNCTION_POINTER_FIELDS
+    __slots__ = _FUNCTION_POINTER_FIELDS
+
+
+class Typedef(Declaration):
+    FIELDS = _COMMON_FIELDS + _FUNCTION_POINTER_FIELDS + ("fingerprint",)
+    __slots__ = _FUNCTION_POINTER_FIELDS
+
+
+class Var(Declaration):
+    FIELDS = _COMMON_FIELDS + _FUNCTION_POINTER_FIELDS + ("value", "fingerprint")
+    __slots__ = _FUNCTION_POINTER_FIELDS + ("value",)
+
+
+class Macro(Declaration):
+    FIELDS = _COMMON_FIELDS + ("value", "fingerprint")
+    __slots__ = ("value",)
+
+
+# Declaration class of each cursor kind, other kinds use Declaration
+KIND_CLASSES = {
+    "FUNCTION_DECL": Function,
+    "PARM_DECL": Parameter,
+    "ENUM_DECL": Enum,
+    "ENUM_CONSTANT_DECL": EnumConstant,
+    "STRUCT_DECL": Struct,
+    "FIELD_DECL": Field,
+    "TYPEDEF_DECL": Typedef,
+    "VAR_DECL": Var,
+    "MACRO_DEFINITION": Macro,
+}
+
+
+def newDeclaration(
+    kind: str, spelling: str, location: str, type: str, result_type: str
+) -> Declaration:
+    """
+    Creates a declaration of the class for its cursor kind
+    """
+    return KIND_CLASSES.get(kind, Declaration)(
+        kind, spelling, location, type, result_type
+    )
+
+
+def asDict(obj) -> dict:
+    """
+    Converts declarations while serializing, for use as the default of json.dump
+    """
+    if isinstance(obj, Declaration):
+        return obj.toDict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
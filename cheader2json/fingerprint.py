@@ -0,0 +1,120 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import hashlib
+import json
+import os
+from typing import IO, Iterable, Optional
+
+from cheader2json.schema_v2 import CHILDREN_FIELDS, childRecords
+
+# Fields that do not change the API of a declaration
+VOLATILE_FIELDS = {
+    "location",
+    "start_line",
+    "end_line",
+    "brief_comment",
+    "raw_comment",
+    "fingerprint",
+}
+
+# Suffix of the file next to an ast file holding the fingerprint of the whole AST
+FINGERPRINT_SUFFIX = ".fingerprint"
+
+
+def _normalized(record: dict) -> dict:
+    normalized = {}
+    for field, value in record.items():
+        if field in VOLATILE_FIELDS:
+            continue
+        if field in CHILDREN_FIELDS:
+            # Child keys are ints in memory and strings once loaded, use their order instead
+            value = [_normalized(child) for child in childRecords(value)]
+        normalized[field] = value
+    return normalized
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def declarationFingerprint(record: dict) -> str:
+    """
+    Computes the fingerprint of a top level declaration record
+
+    The fingerprint covers everything in the record (signature, arguments, members,
+    constants and values) except where the declaration is and how it is documented, so
+    declarations with equal fingerprints have no changes for a diff to find.
+    """
+    return _digest(
+        json.dumps(_normalized(record), sort_keys=True, separators=(",", ":")).encode(
+            "utf-8"
+        )
+    )
+
+
+def combineFingerprints(fingerprints: Iterable[Optional[str]]) -> Optional[str]:
+    """
+    Computes the fingerprint of a whole AST from the fingerprints of its declarations,
+    independent of their order
+    @return: The fingerprint, or None if any declaration has no fingerprint
+    """
+    fingerprints = list(fingerprints)
+    if None in fingerprints:
+        return None
+    return _digest("\n".join(sorted(fingerprints)).encode("ascii"))
+
+
+def astFingerprint(records: Iterable[dict]) -> Optional[str]:
+    """
+    Computes the fingerprint of a whole AST from its declaration records
+    @return: The fingerprint, or None if any declaration has no fingerprint
+    """
+    return combineFingerprints(record.get("fingerprint") for record in records)
+
+
+def writeAstFingerprint(astPath: str, fingerprint: Optional[str]):
+    """
+    Writes the fingerprint of a whole AST next to its ast file, along with the size and
+    modification time of the ast file to tell if the ast file was replaced since
+    @param astPath: The path of the written ast file
+    @param fingerprint: The fingerprint of the AST, None removes a previous one
+    """
+    path = astPath + FINGERPRINT_SUFFIX
+    if fingerprint is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    st = os.stat(astPath)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "fingerprint": fingerprint,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+            },
+            f,
+        )
+
+
+def readAstFingerprint(f: IO) -> Optional[str]:
+    """
+    Reads the fingerprint written next to an ast file, without reading the ast file
+    @param f: The opened ast file
+    @return: The fingerprint, or None if there is none or the ast file has a different
+        size or modification time than when it was written
+    """
+    try:
+        with open(f.name + FINGERPRINT_SUFFIX) as sidecar:
+            data = json.load(sidecar)
+        st = os.fstat(f.fileno())
+        if data["size"] != st.st_size or data["mtime_ns"] != st.st_mtime_ns:
+            return None
+        return data["fingerprint"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
@@ -0,0 +1,174 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import fnmatch
+import posixpath
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from cheader2json.cheader_reader import CHeaderParser
+
+# Include directives of a header, the files they name are read from the same revision so
+# includes resolve to the contents of that revision
+_INCLUDE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"\r\n]+)[>"]', re.MULTILINE)
+
+
+class GitSourceError(Exception):
+    pass
+
+
+def _git(repo: str, args: List[str], stdin: Optional[bytes] = None) -> bytes:
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo] + args, input=stdin, capture_output=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise GitSourceError(
+            f"git {' '.join(args[:2])} failed: {e.stderr.decode(errors='replace').strip()}"
+        ) from e
+    return result.stdout
+
+
+def _readBlobs(repo: str, objects: List[str]) -> List[bytes]:
+    """
+    Reads blobs from the object store with a single git cat-file process
+    """
+    if not objects:
+        return []
+    output = _git(repo, ["cat-file", "--batch"], "\n".join(objects).encode() + b"\n")
+    blobs = []
+    position = 0
+    for _ in objects:
+        headerEnd = output.index(b"\n", position)
+        size = int(output[position:headerEnd].split()[2])
+        blobs.append(output[headerEnd + 1 : headerEnd + 1 + size])
+        # Each blob is followed by a newline
+        position = headerEnd + 1 + size + 1
+    return blobs
+
+
+def _includes(path: str, contents: bytes, blobs: dict) -> List[str]:
+    """
+    Gets the files of a revision that the include directives of a file resolve to
+    @param path: The path of the file in the revision
+    @param contents: The contents of the file
+    @param blobs: The object ids of the files of the revision, by path
+    @return: The paths of the included files, relative to the directory of the including
+        file or else to the repository root. Includes of files outside the revision (such
+        as system headers) and includes named by macros are left out.
+    """
+    directory = posixpath.dirname(path)
+    includes = []
+    for match in _INCLUDE.finditer(contents):
+        name = match.group(1).decode("utf-8", errors="surrogateescape")
+        for candidate in (posixpath.join(directory, name), name):
+            candidate = posixpath.normpath(candidate)
+            if candidate in blobs:
+                includes.append(candidate)
+                break
+    return includes
+
+
+def revisionSources(
+    repo: str, rev: str, headerPaths: List[str]
+) -> Tuple[List[str], List[Tuple[str, bytes]]]:
+    """
+    Reads the header files of a git revision from the object store, without a checkout
+    @param repo: Path to the git repository
+    @param rev: The revision (tag, branch or commit) to read
+    @param headerPaths: Paths or glob patterns of the headers to convert, relative to the repository root
+    @return: The names of the headers to parse, and the (name, contents) of the headers
+        and every file they include (directly or indirectly) from the revision. Names are
+        of the form <rev>:<path>, so they never exist on disk.
+    """
+    listing = _git(repo, ["ls-tree", "-r", "-z", "--full-tree", rev])
+    blobs = {}
+    for item in listing.split(b"\0"):
+        if not item:
+            continue
+        meta, path = item.split(b"\t", 1)
+        _mode, objectType, objectId = meta.split()
+        if objectType == b"blob":
+            blobs[path.decode("utf-8", errors="surrogateescape")] = objectId.decode()
+
+    headers = []
+    for pattern in headerPaths:
+        if pattern.startswith("./"):
+            pattern = pattern[2:]
+        matches = (
+            [pattern] if pattern in blobs else fnmatch.filter(sorted(blobs), pattern)
+        )
+        if not matches:
+            raise GitSourceError(f"No files matching {pattern} in {rev}")
+        headers.extend(m for m in matches if m not in headers)
+
+    # Only the headers and the files their includes resolve to are read, one git process
+    # per level of includes
+    contents = {}
+    pending = headers
+    while pending:
+        paths = [p for p in dict.fromkeys(pending) if p not in contents]
+        contents.update(zip(paths, _readBlobs(repo, [blobs[p] for p in paths])))
+        pending = [
+            include for p in paths for include in _includes(p, contents[p], blobs)
+        ]
+    unsavedFiles = [(f"{rev}:{p}", data) for p, data in contents.items()]
+    return [f"{rev}:{h}" for h in headers], unsavedFiles
+
+
+def convertRevision(
+    repo: str,
+    rev: str,
+    headerPaths: List[str],
+    ignoredMacros: List[str],
+    deprecationMacros: Optional[List[str]] = None,
+    annotationMacros: Optional[List[str]] = None,
+) -> dict:
+    """
+    Converts the headers of a git revision
+    @return: The parsed info of the headers, in the same shape as CHeaderParser.parsedInfo
+    """
+    headers, unsavedFiles = revisionSources(repo, rev, headerPaths)
+    parser = CHeaderParser(
+        headers,
+        ignoredMacros,
+        deprecationMacros=deprecationMacros,
+        annotationMacros=annotationMacros,
+        unsavedFiles=unsavedFiles,
+    )
+    return parser.parsedInfo
+
+
+def convertRevisions(
+    repo: str,
+    revs: List[str],
+    headerPaths: List[str],
+    ignoredMacros: List[str],
+    deprecationMacros: Optional[List[str]] = None,
+    annotationMacros: Optional[List[str]] = None,
+) -> List[dict]:
+    """
+    Converts the headers of several git revisions concurrently, one worker process each
+    @return: The parsed info of each revision, in the order the revisions were given
+    """
+    with ProcessPoolExecutor(max_workers=len(revs)) as pool:
+        futures = [
+            pool.submit(
+                convertRevision,
+                repo,
+                rev,
+                headerPaths,
+                ignoredMacros,
+                deprecationMacros,
+                annotationMacros,
+            )
+            for rev in revs
+        ]
+        return [future.result() for future in futures]
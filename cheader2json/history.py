@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+History of an API across a series of versions, used by the `history` command. Every
+version is loaded and indexed once, the diffs between consecutive versions are
+computed on a pool of worker processes, and the changes are collected into a timeline
+of each symbol (function, parameter, enum, enum constant, struct, struct field,
+typedef, variable or macro).
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cheader2json.ast_index import AstIndex
+from cheader2json.change_search import Change, iterChanges
+
+# Suffixes of ast file names, left out of the version labels
+_AST_SUFFIXES = (".ast.json", ".ast.ndjson", ".ast.bin")
+
+
+class HistoryEvent(NamedTuple):
+    """
+    A change to a symbol in a version
+
+    @ivar version: The label of the version the change was made in
+    @ivar change: "added", "removed", "changed", "deprecated" or "undeprecated"
+    @ivar field: The attribute that changed, for "changed" events
+    @ivar old: The old value of the attribute
+    @ivar new: The new value of the attribute, or a summary of an added symbol
+    """
+
+    version: str
+    change: str
+    field: Optional[str] = None
+    old: object = None
+    new: object = None
+
+
+class History(NamedTuple):
+    """
+    The history of an API
+
+    @ivar versions: The label of each version, in order
+    @ivar diffs: The changes from each version to the next, diffs[i] leads to
+        versions[i + 1]
+    @ivar timeline: The events of each symbol by (kind, path), in the order symbols
+        first changed. Symbols of the first version have no "added" event.
+    """
+
+    versions: List[str]
+    diffs: List[List[Change]]
+    timeline: Dict[Tuple[str, Tuple[str, ...]], List[HistoryEvent]]
+
+
+def versionLabel(path: str) -> str:
+    """
+    Gets the label of a version from the name of its ast file, e.g. helics-3.1 for
+    out/helics-3.1.ast.json
+    """
+    name = os.path.basename(path)
+    for suffix in _AST_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _versionLabels(paths: List[str]) -> List[str]:
+    labels = [versionLabel(p) for p in paths]
+    if len(set(labels)) != len(labels):
+        # Files with the same name in different directories
+        return list(paths)
+    return labels
+
+
+# Versions inherited by the worker processes of the pool, see _consecutiveDiffs
+_workerVersions: List[AstIndex] = []
+
+
+def _initWorker(versions: List[AstIndex]):
+    global _workerVersions
+    _workerVersions = versions
+
+
+def _diffVersions(i: int) -> List[Change]:
+    return list(iterChanges(_workerVersions[i], _workerVersions[i + 1]))
+
+
+def _consecutiveDiffs(versions: List[AstIndex], workers: int) -> List[List[Change]]:
+    """
+    Diffs each version against the next one
+
+    Forked worker processes inherit the indexed versions instead of loading them again.
+    Where processes can't be forked (Windows), or with a single worker, the diffs are
+    computed in this process.
+    """
+    pairs = len(versions) - 1
+    workers = min(workers, pairs)
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [list(iterChanges(old, new)) for old, new in zip(versions, versions[1:])]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_initWorker,
+        initargs=(versions,),
+    ) as pool:
+        return list(pool.map(_diffVersions, range(pairs)))
+
+
+def _event(version: str, change: Change) -> HistoryEvent:
+    if change.field == "deprecated":
+        return HistoryEvent(version, "deprecated" if change.new else "undeprecated")
+    return HistoryEvent(version, change.change, change.field, change.old, change.new)
+
+
+def apiHistory(paths: List[str], workers: Optional[int] = None) -> History:
+    """
+    Computes the history of an API from the ast files of its versions
+    @param paths: The ast files (json, ndjson or binary) of each version, oldest first
+    @param workers: Number of worker processes computing the diffs, the number of CPUs
+        if not given
+    """
+    versions = [AstIndex.load(p) for p in paths]
+    labels = _versionLabels(paths)
+    diffs = _consecutiveDiffs(versions, workers or os.cpu_count() or 1)
+    timeline: Dict[Tuple[str, Tuple[str, ...]], List[HistoryEvent]] = {}
+    for version, changes in zip(labels[1:], diffs):
+        for change in changes:
+            if change.change == "unknown":
+                continue
+            timeline.setdefault((change.kind, tuple(change.path)), []).append(
+                _event(version, change)
+            )
+    return History(labels, diffs, timeline)
+
+
+def formatEvent(event: HistoryEvent) -> str:
+    """
+    Formats an event of a timeline as a human-readable line
+    """
+    if event.change == "changed":
+        return f"{event.version}: {event.field} changed from {event.old} to {event.new}"
+    if event.change == "added" and event.new is not None:
+        return f"{event.version}: added ({event.new})"
+    return f"{event.version}: {event.change}"
@@ -0,0 +1,130 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from importlib import metadata
+from typing import Dict, List, Optional, Tuple
+
+# Bump whenever the layout of the cached records changes
+CACHE_FORMAT_VERSION = 2
+
+
+def _libclangVersion() -> str:
+    try:
+        return metadata.version("libclang")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _fileDigest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class ParseCache(object):
+    """
+    On-disk cache of the cursor info records and type map contributions of parsed headers
+
+    Entries are keyed on the header path and contents, the ignored macros, any other
+    settings given in extraKey and the libclang version. Each entry also records the digests of every file the header
+    includes, and is only used if none of those have changed.
+    The cache directory is trusted, entries are stored with pickle.
+    """
+
+    def __init__(
+        self,
+        cacheDir: str,
+        ignoredMacros: List[str],
+        unsavedFiles: Optional[List[Tuple[str, bytes]]] = None,
+        extraKey: Optional[List[str]] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.cacheDir = cacheDir
+        # Files parsed from memory are hashed using those contents instead of the disk
+        self._unsavedDigests = {
+            path: hashlib.sha256(
+                contents.encode("utf-8") if isinstance(contents, str) else contents
+            ).hexdigest()
+            for path, contents in unsavedFiles or []
+        }
+        self._salt = "\0".join(
+            [str(CACHE_FORMAT_VERSION), _libclangVersion()]
+            + sorted(set(ignoredMacros))
+            + list(extraKey or [])
+        )
+        # Log through the parser using the cache, so messages reach its handlers
+        self.logger = logger or logging.getLogger(__name__)
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def _digest(self, path: str) -> Optional[str]:
+        if path in self._unsavedDigests:
+            return self._unsavedDigests[path]
+        return _fileDigest(path)
+
+    def _entryPath(self, headerFile: str) -> Optional[str]:
+        headerDigest = self._digest(headerFile)
+        if headerDigest is None:
+            return None
+        key = hashlib.sha256(
+            "\0".join([self._salt, headerFile, headerDigest]).encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.cacheDir, f"{key}.pickle")
+
+    def load(self, headerFile: str) -> Optional[Tuple[list, dict]]:
+        """
+        Loads the cached parse results for a header
+        @param headerFile: The C header file to look up
+        @return: The cursor info records and type map contributions, or None on a cache miss
+        """
+        entryPath = self._entryPath(headerFile)
+        if entryPath is None or not os.path.exists(entryPath):
+            return None
+        try:
+            with open(entryPath, "rb") as f:
+                entry = pickle.load(f)
+        except Exception as e:
+            # Unpickling a damaged entry can raise almost any exception
+            self.logger.warning(f"Ignoring unreadable cache entry {entryPath}: {e}")
+            return None
+        for include, digest in entry["includes"].items():
+            if self._digest(include) != digest:
+                return None
+        return entry["records"], entry["types"]
+
+    def store(self, headerFile: str, records: list, types: dict, includes: List[str]):
+        """
+        Stores the parse results for a header
+        @param headerFile: The C header file that was parsed
+        @param records: The cursor info records extracted from the header
+        @param types: The type map contributions of the header
+        @param includes: The files included (directly or indirectly) by the header
+        """
+        entryPath = self._entryPath(headerFile)
+        if entryPath is None:
+            return
+        includeDigests: Dict[str, Optional[str]] = {
+            include: self._digest(include) for include in includes
+        }
+        entry = {"includes": includeDigests, "records": records, "types": types}
+        # Write to a temporary file first so concurrent runs never see a partial entry
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, entryPath)
+        except OSError:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
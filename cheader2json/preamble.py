@@ -0,0 +1,111 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional
+
+import clang.cindex as cidx
+
+from cheader2json.parse_cache import _fileDigest, _libclangVersion
+
+# Name of the synthetic source that includes every preamble header
+_PREAMBLE_SOURCE = "cheader2json_preamble.h"
+
+
+class PrecompiledPreamble(object):
+    """
+    Precompiled header for a set of include files shared by the headers being parsed
+
+    The PCH is stored on disk keyed on the preamble headers and their contents, and is
+    reused by later runs as long as none of the files it includes have changed.
+    Headers that are part of the preamble themselves are parsed without it, since their
+    include guards would otherwise hide their contents.
+    """
+
+    def __init__(
+        self,
+        pchDir: str,
+        preambleHeaders: List[str],
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.pchDir = pchDir
+        self.preambleHeaders = [os.path.abspath(h) for h in preambleHeaders]
+        self.includes = []
+        self._built = False
+        # Log through the parser using the preamble, so messages reach its handlers
+        self.logger = logger or logging.getLogger(__name__)
+        key = hashlib.sha256(
+            "\0".join(
+                [_libclangVersion()]
+                + [f"{h}\0{_fileDigest(h)}" for h in self.preambleHeaders]
+            ).encode("utf-8")
+        ).hexdigest()
+        self.pchPath = os.path.join(pchDir, f"{key}.pch")
+        self._manifestPath = os.path.join(pchDir, f"{key}.json")
+        os.makedirs(pchDir, exist_ok=True)
+
+    def _isUpToDate(self) -> bool:
+        if not os.path.exists(self.pchPath) or not os.path.exists(self._manifestPath):
+            return False
+        try:
+            with open(self._manifestPath, "r", encoding="utf-8") as f:
+                includeDigests = json.load(f)
+        except (OSError, ValueError):
+            return False
+        for include, digest in includeDigests.items():
+            if _fileDigest(include) != digest:
+                return False
+        self.includes = list(includeDigests.keys())
+        return True
+
+    def build(self, idx: cidx.Index) -> None:
+        """
+        Builds the precompiled header, unless an up to date one is already on disk
+        @param idx: The clang index used to parse the preamble headers
+        """
+        if self._built:
+            return
+        self._built = True
+        if self._isUpToDate():
+            self.logger.info(f"Reusing precompiled preamble {self.pchPath}")
+            return
+        source = "".join(f'#include "{h}"\n' for h in self.preambleHeaders)
+        try:
+            tu = idx.parse(
+                _PREAMBLE_SOURCE,
+                args=["-x", "c-header"],
+                unsaved_files=[(_PREAMBLE_SOURCE, source)],
+                options=cidx.TranslationUnit.PARSE_INCOMPLETE
+                | cidx.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+            )
+            tu.save(self.pchPath)
+        except (cidx.TranslationUnitLoadError, cidx.TranslationUnitSaveError) as e:
+            raise Exception(
+                f"Error precompiling preamble headers {self.preambleHeaders}"
+            ) from e
+        self.includes = sorted(
+            set(self.preambleHeaders)
+            | {os.path.abspath(inc.include.name) for inc in tu.get_includes()}
+        )
+        with open(self._manifestPath, "w", encoding="utf-8") as f:
+            json.dump({include: _fileDigest(include) for include in self.includes}, f)
+        self.logger.info(f"Built precompiled preamble {self.pchPath}")
+
+    def argsFor(self, headerFile: str) -> List[str]:
+        """
+        Gets the clang arguments needed to use the preamble when parsing a header
+        @param headerFile: The C header file that will be parsed
+        @return: The arguments, empty if the header is itself part of the preamble
+        """
+        if os.path.abspath(headerFile) in self.includes:
+            return []
+        # Contents were already validated using file digests, skip clang's mtime checks
+        return ["-include-pch", self.pchPath, "-Xclang", "-fno-validate-pch"]
@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Version 2 of the ast and types json schema. An ast.json file is an object of the form
+
+    {"schema": 2, "declarations": [...], "files": [...]}
+
+with the top level records in "declarations", the children of records ("arguments",
+"enumerations" and "members") as arrays instead of objects keyed by position, and
+every "location" as the index of the path in "files". A types.json file is an object
+of the form
+
+    {"schema": 2, "types": {...}, "functions": {...}}
+
+with the functions using each type in "types", and the index of each function in the
+declarations of the ast.json file in "functions", instead of a copy of its arguments.
+"""
+
+import json
+from collections.abc import Mapping
+from typing import IO, Dict, Iterable, Iterator
+
+# Fields holding the child records of a declaration, in order
+CHILDREN_FIELDS = ("arguments", "enumerations", "members")
+
+
+def childRecords(children) -> Iterable[dict]:
+    """
+    Gets the child records of a declaration in order, from either schema
+    @param children: The value of one of the CHILDREN_FIELDS
+    """
+    if isinstance(children, dict):
+        return children.values()
+    return children
+
+
+def _compactRecord(record: dict, files: Dict[str, int]) -> dict:
+    compact = {}
+    for field, value in record.items():
+        if field == "location":
+            value = files.setdefault(value, len(files))
+        elif field in CHILDREN_FIELDS:
+            value = [_compactRecord(child, files) for child in value.values()]
+        compact[field] = value
+    return compact
+
+
+class JsonAstV2Writer(object):
+    """
+    Writes top level AST records to a version 2 ast.json file one record at a time
+
+    The files table is written after the declarations, once all paths are known.
+    @ivar functions: The index of each function written, for the types.json file
+    """
+
+    def __init__(self, f: IO[str], compact: bool = False):
+        self.f = f
+        self.compact = compact
+        self.functions: Dict[str, int] = {}
+        self._files: Dict[str, int] = {}
+        self._count = 0
+        self.f.write('{"schema": 2, "declarations": [')
+
+    def write(self, key, record: dict):
+        """
+        Writes a single top level record
+        @param key: The parsedInfo key of the record (its position is used instead)
+        @param record: The cursor info record
+        """
+        if record["kind"] == "FUNCTION_DECL":
+            self.functions[record["spelling"]] = self._count
+        record = _compactRecord(record, self._files)
+        separator = "," if self._count else ""
+        if self.compact:
+            self.f.write(separator + json.dumps(record, separators=(",", ":")))
+        else:
+            value = json.dumps(record, indent=4).replace("\n", "\n    ")
+            self.f.write(f"{separator}\n    {value}")
+        self._count += 1
+
+    def close(self):
+        """
+        Terminates the declarations and writes the files table
+        """
+        if self._count and not self.compact:
+            self.f.write("\n")
+        self.f.write('], "files": ')
+        self.f.write(json.dumps(list(self._files), separators=(",", ":")))
+        self.f.write("}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def dumpTypesV2(
+    f: IO[str], types: dict, functions: Dict[str, int], compact: bool = False
+):
+    """
+    Writes the types map as a version 2 types.json file
+    @param types: The types map of a CHeaderParser
+    @param functions: The index of each function in the ast.json file
+    """
+    data = {
+        "schema": 2,
+        "types": {k: v for k, v in types.items() if k != "functions"},
+        "functions": {
+            name: functions[name] for name in types["functions"] if name in functions
+        },
+    }
+    if compact:
+        json.dump(data, f, separators=(",", ":"))
+    else:
+        json.dump(data, f, indent=4)
+
+
+def isAstV2(data) -> bool:
+    return isinstance(data, dict) and data.get("schema") == 2
+
+
+class AstV2(Mapping):
+    """
+    A loaded version 2 ast.json file, as a mapping of the position of each declaration
+    to its record. The locations of declarations are resolved to paths, the locations
+    of their children stay indexes into files.
+    """
+
+    def __init__(self, data: dict):
+        self.files = data["files"]
+        self._records = data["declarations"]
+        for record in self._records:
+            record["location"] = self.files[record["location"]]
+
+    def __getitem__(self, key) -> dict:
+        try:
+            index = int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key) from None
+        if not 0 <= index < len(self._records):
+            raise KeyError(key)
+        return self._records[index]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._records)))
+
+    def __len__(self) -> int:
+        return len(self._records)
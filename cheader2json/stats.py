@@ -0,0 +1,97 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+
+class ParseStats(object):
+    """
+    Timings and counters collected while converting headers
+
+    @ivar phases: total seconds spent in each phase (index, preamble, cache, parse, walk,
+        merge, serialize)
+    @ivar headers: per header seconds spent in each phase, plus diagnostics counts
+    @ivar cursorKinds: number of cursors extracted, by cursor kind
+    @ivar diagnostics: number of libclang diagnostics, by severity
+    @ivar counters: other counters, such as type cache hits and misses
+    """
+
+    def __init__(self):
+        self.phases = Counter()
+        self.headers = {}
+        self.cursorKinds = Counter()
+        self.diagnostics = Counter()
+        self.counters = Counter()
+
+    def _header(self, header: str) -> dict:
+        if header not in self.headers:
+            self.headers[header] = {"phases": Counter(), "diagnostics": Counter()}
+        return self.headers[header]
+
+    @contextmanager
+    def timed(self, phase: str, header: Optional[str] = None):
+        """
+        Context manager that adds the time spent in its body to a phase
+        @param phase: The name of the phase
+        @param header: The header the time is attributed to, if any
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(phase, time.perf_counter() - start, header)
+
+    def addTime(self, phase: str, seconds: float, header: Optional[str] = None):
+        self.phases[phase] += seconds
+        if header is not None:
+            self._header(header)["phases"][phase] += seconds
+
+    def countDiagnostics(self, header: str, diagnostics):
+        """
+        Counts the diagnostics of a translation unit by severity
+        """
+        counts = self._header(header)["diagnostics"]
+        for d in diagnostics:
+            severity = _SEVERITY_NAMES.get(d.severity, str(d.severity))
+            counts[severity] += 1
+            self.diagnostics[severity] += 1
+
+    def merge(self, other: "ParseStats"):
+        """
+        Adds the timings and counters of another instance, e.g. from a worker process
+        """
+        self.phases.update(other.phases)
+        self.cursorKinds.update(other.cursorKinds)
+        self.diagnostics.update(other.diagnostics)
+        self.counters.update(other.counters)
+        for header, values in other.headers.items():
+            mine = self._header(header)
+            mine["phases"].update(values["phases"])
+            mine["diagnostics"].update(values["diagnostics"])
+
+    def toDict(self) -> dict:
+        return {
+            "phases": dict(self.phases),
+            "headers": {
+                header: {
+                    "phases": dict(values["phases"]),
+                    "diagnostics": dict(values["diagnostics"]),
+                }
+                for header, values in self.headers.items()
+            },
+            "cursor_kinds": dict(self.cursorKinds.most_common()),
+            "diagnostics": dict(self.diagnostics),
+            "counters": dict(self.counters),
+        }
+
+
+# Names of clang.cindex.Diagnostic severities, kept here so this module never loads libclang
+_SEVERITY_NAMES = {0: "ignored", 1: "note", 2: "warning", 3: "error", 4: "fatal"}
@@ -0,0 +1,131 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+File-scoped traversal of the top level cursors of a translation unit.
+
+With PARSE_DETAILED_PROCESSING_RECORD the translation unit has a top level cursor for
+every macro definition and declaration of every included system header. Going through
+Cursor.get_children() and cursor.location.file.name costs several libclang calls, a
+File object and a string conversion for each of them, only to discard almost all.
+Here each cursor is checked in the visitor callback with two libclang calls, by
+comparing the handle of the file it is expanded in against the handles of the
+requested files, and only the cursors from those files are kept.
+"""
+
+import ctypes
+import os
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+import clang.cindex as cidx
+
+T = TypeVar("T")
+
+# Prototypes of the libclang functions returning file handles as plain integers,
+# created on first use so importing this module does not load libclang
+_functions = None
+
+
+def _libclangFunctions():
+    global _functions
+    if _functions is None:
+        lib = cidx.conf.lib
+        # Indexing the library gives new function objects, so the argument and result
+        # types set here do not change the ones used by clang.cindex
+        getFile = lib["clang_getFile"]
+        getFile.argtypes = [cidx.TranslationUnit, ctypes.c_char_p]
+        getFile.restype = ctypes.c_void_p
+        getLocationFile = lib["clang_getInstantiationLocation"]
+        getLocationFile.argtypes = [
+            cidx.SourceLocation,
+            ctypes.POINTER(ctypes.c_void_p),
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+        ]
+        getLocationFile.restype = None
+        _functions = (getFile, getLocationFile, lib.clang_getCursorLocation)
+    return _functions
+
+
+def fileHandles(tu: cidx.TranslationUnit, files: Dict[str, T]) -> Dict[int, T]:
+    """
+    Looks up the libclang handles of files in a translation unit
+    @param tu: The parsed translation unit
+    @param files: Values to map each file to, by file name
+    @return: The values by file handle, files that are not part of the translation unit are left out
+    """
+    getFile = _libclangFunctions()[0]
+    handles = {}
+    unresolved = {}
+    for name, value in files.items():
+        handle = getFile(tu, name.encode("utf-8", errors="surrogateescape"))
+        # The main file always has the handle it was parsed with, but a handle looked up
+        # by name for another file is only the one its cursors have if the file was
+        # included with the same spelling
+        if handle and name == tu.spelling:
+            handles.setdefault(handle, value)
+        else:
+            unresolved[name] = (handle, value)
+    if not unresolved:
+        return handles
+    included = {}
+    for inclusion in tu.get_includes():
+        include = inclusion.include
+        included.setdefault(ctypes.addressof(include.obj.contents), include.name)
+    realFiles = {}
+    for name, (handle, value) in unresolved.items():
+        if handle in included:
+            handles.setdefault(handle, value)
+        else:
+            realFiles.setdefault(os.path.realpath(name), value)
+    if not realFiles:
+        return handles
+    # Match the files that were included with a differently spelled path by resolved path
+    for handle, name in included.items():
+        value = realFiles.get(os.path.realpath(name))
+        if value is not None:
+            handles.setdefault(handle, value)
+    return handles
+
+
+def fileCursors(
+    tu: cidx.TranslationUnit,
+    files: Dict[str, T],
+    wantsKind: Optional[Callable[[cidx.Cursor], bool]] = None,
+) -> List[Tuple[cidx.Cursor, T]]:
+    """
+    Gets the top level cursors of a translation unit that are located in the given files
+    @param tu: The parsed translation unit
+    @param files: Values to map each file to, by file name. Different spellings of the
+        same file resolve to the same handle.
+    @param wantsKind: Called before the location of a cursor is looked up, cursors it
+        returns False for are skipped
+    @return: The cursors, in translation unit order, with the value of their file
+    """
+    _getFile, getLocationFile, getCursorLocation = _libclangFunctions()
+    owners = fileHandles(tu, files)
+    cursors = []
+    if not owners:
+        return cursors
+    handle = ctypes.c_void_p()
+    handleRef = ctypes.byref(handle)
+
+    def visitor(child, _parent, _data):
+        if wantsKind is not None and not wantsKind(child):
+            return 1  # CXChildVisit_Continue
+        getLocationFile(getCursorLocation(child), handleRef, None, None, None)
+        owner = owners.get(handle.value)
+        if owner is not None:
+            # Keep the translation unit alive as long as the cursor, like get_children() does
+            child._tu = tu
+            cursors.append((child, owner))
+        return 1  # CXChildVisit_Continue
+
+    cidx.conf.lib.clang_visitChildren(
+        tu.cursor, cidx.callbacks["cursor_visit"](visitor), None
+    )
+    return cursors
@@ -0,0 +1,113 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+"""
+
+import sys
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import clang.cindex as cidx
+
+# Number of distinct types kept per translation unit unless another size is given
+DEFAULT_TYPE_CACHE_SIZE = 4096
+
+
+class ResolvedType(NamedTuple):
+    """
+    The facts about a type used when extracting cursor info
+    """
+
+    kind: cidx.TypeKind
+    # Kind spelling, or the spelling of the named type for elaborated types
+    name: str
+    spelling: str
+    pointerDepth: int
+    # "_" followed by a "*" per level of pointers
+    pointerSuffix: str
+    # Typedef name, or kind spelling, of the type after removing all pointers
+    pointeeName: str
+    # Result type spelling if this is a pointer to a function prototype
+    functionPointerResult: Optional[str]
+
+
+def _resolve(t: cidx.Type) -> ResolvedType:
+    kind = t.kind
+    name = (
+        kind.spelling
+        if kind != cidx.TypeKind.ELABORATED
+        else t.get_named_type().spelling
+    )
+    functionPointerResult = None
+    if kind == cidx.TypeKind.POINTER:
+        pointee = t.get_pointee()
+        if pointee.kind == cidx.TypeKind.FUNCTIONPROTO:
+            functionPointerResult = pointee.get_result().spelling
+    depth = 0
+    suffix = "_"
+    typePointee = t
+    while typePointee.kind == cidx.TypeKind.POINTER:
+        depth += 1
+        suffix += "*"
+        typePointee = typePointee.get_pointee()
+    if typePointee.kind == cidx.TypeKind.ELABORATED:
+        typePointee = typePointee.get_named_type()
+    pointeeName = (
+        typePointee.get_typedef_name()
+        if typePointee.kind == cidx.TypeKind.TYPEDEF
+        else typePointee.kind.spelling
+    )
+    # Every cursor of a type shares these names, keep a single copy of each
+    return ResolvedType(
+        kind,
+        sys.intern(name),
+        sys.intern(t.spelling),
+        depth,
+        suffix,
+        sys.intern(pointeeName),
+        functionPointerResult,
+    )
+
+
+class TypeCache(object):
+    """
+    Bounded cache of resolved types for a single translation unit
+
+    Types are keyed on the type handle libclang returns, which identifies the type as
+    written (typedef sugar and qualifiers included) within its translation unit, so a
+    lookup needs no calls into libclang. The least recently used types are evicted
+    once the cache is full.
+
+    @ivar hits: number of lookups answered from the cache
+    @ivar misses: number of lookups that had to resolve the type
+    """
+
+    def __init__(self, maxSize: int = DEFAULT_TYPE_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._resolved = OrderedDict()
+
+    def resolve(self, t: cidx.Type) -> ResolvedType:
+        """
+        Gets the resolved facts of a type
+        @param t: A type from the translation unit this cache belongs to
+        """
+        key = (t._kind_id, t.data[0], t.data[1])
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            self.hits += 1
+            self._resolved.move_to_end(key)
+            return resolved
+        self.misses += 1
+        resolved = _resolve(t)
+        self._resolved[key] = resolved
+        if len(self._resolved) > self.maxSize:
+            self._resolved.popitem(last=False)
+        return resolved
+
+    def __len__(self) -> int:
+        return len(self._resolved)
@@ -0,0 +1,272 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Long-lived conversion that keeps translation units alive and only reparses headers
+whose files changed, used by `convert --watch` and the `serve` command.
+
+The server listens on a Unix socket and handles one request at a time. Each request
+is a single line of json:
+    {"cwd": str, "headers": [str], "prefix": str, "ignore_macros": [str],
+     "deprecation_macros": [str], "annotation_macros": [str], "format": str,
+     "compact": bool, "include_kinds": [str], "exclude_kinds": [str],
+     "include_names": [str], "exclude_names": [str], "omit_fields": [str]}
+and is answered with a single line of json:
+    {"status": "ok", "reparsed": [str], "written": [str], "seconds": float}
+or {"status": "error", "message": str}.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import time
+from typing import Dict, List, Optional, Tuple
+
+import clang.cindex as cidx
+
+from cheader2json.ast_writer import dumpTypes, openAstWriter
+from cheader2json.cheader_reader import CHeaderParser
+from cheader2json.cursor_filter import CursorFilter
+from cheader2json.fingerprint import combineFingerprints, writeAstFingerprint
+
+
+class IncrementalConverter(object):
+    """
+    Converts a set of headers repeatedly, reparsing only the headers for which the
+    header file or one of the files it includes changed since the previous update
+    """
+
+    def __init__(
+        self,
+        headers: List[str],
+        ignoredMacros: List[str],
+        deprecationMacros: Optional[List[str]] = None,
+        annotationMacros: Optional[List[str]] = None,
+        cursorFilter: Optional[CursorFilter] = None,
+    ):
+        self.headers = headers
+        self.ignoredMacros = ignoredMacros
+        self.parser = CHeaderParser(
+            headers,
+            ignoredMacros,
+            parse=False,
+            deprecationMacros=deprecationMacros,
+            annotationMacros=annotationMacros,
+            cursorFilter=cursorFilter,
+        )
+        self.logger = self.parser.clangLogger
+        self._units: Dict[str, cidx.TranslationUnit] = {}
+        self._results: Dict[str, Tuple[list, dict]] = {}
+        self._stamps: Dict[str, dict] = {}
+        self._written: Dict[str, bytes] = {}
+
+    def _stat(self, paths: List[str]) -> dict:
+        stamps = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def update(self) -> List[str]:
+        """
+        Parses new headers and reparses the headers whose files changed
+        @return: The headers that were (re)parsed
+        """
+        reparsed = []
+        for header in self.headers:
+            unit = self._units.get(header)
+            if unit is not None:
+                previous = self._stamps[header]
+                if self._stat(list(previous)) == previous:
+                    continue
+            # Stat before parsing, so edits made during the parse are picked up next time
+            stamps = self._stat([header] + list(self._stamps.get(header, {})))
+            try:
+                if unit is None:
+                    index = self.parser._getIndex()
+                    with self.parser.stats.timed("parse", header):
+                        unit = index.parse(
+                            header,
+                            options=cidx.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+                            | cidx.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE,
+                        )
+                    self._units[header] = unit
+                else:
+                    with self.parser.stats.timed("parse", header):
+                        unit.reparse()
+            except cidx.TranslationUnitLoadError as e:
+                if unit is None:
+                    raise Exception(f"Error parsing {header}") from e
+                self.logger.error(f"Error reparsing {header}, keeping previous results")
+                self._stamps[header] = stamps
+                continue
+            self.parser.stats.countDiagnostics(header, unit.diagnostics)
+            records, headerTypes, includes = self.parser._extractHeader(
+                unit, header, self.ignoredMacros
+            )
+            self._results[header] = (records, headerTypes)
+            stamps.update(self._stat([i for i in includes if i not in stamps]))
+            self._stamps[header] = stamps
+            reparsed.append(header)
+        return reparsed
+
+    def _render(
+        self, outputFormat: str, compact: bool
+    ) -> Tuple[bytes, bytes, Optional[str]]:
+        # Records are modified while finishing them, so finish shallow copies
+        results = [
+            ([r.copy() for r in records], headerTypes)
+            for records, headerTypes in (self._results[h] for h in self.headers)
+        ]
+        self.parser._resetTypes()
+        astBuffer = io.BytesIO() if outputFormat == "bin" else io.StringIO()
+        fingerprints = []
+        with openAstWriter(astBuffer, outputFormat, compact) as writer:
+            for key, record in self.parser._finishHeaders(results, self.ignoredMacros):
+                writer.write(key, record)
+                fingerprints.append(record.get("fingerprint"))
+        typesBuffer = io.StringIO()
+        dumpTypes(typesBuffer, self.parser._types, compact)
+        ast = astBuffer.getvalue()
+        if isinstance(ast, str):
+            ast = ast.encode("utf-8")
+        return (
+            ast,
+            typesBuffer.getvalue().encode("utf-8"),
+            combineFingerprints(fingerprints),
+        )
+
+    def writeOutputs(
+        self, prefix: str, outputFormat: str = "json", compact: bool = False
+    ) -> List[str]:
+        """
+        Writes the ast and types files, skipping files whose contents did not change
+        @return: The files that were written
+        """
+        ast, types, fingerprint = self._render(outputFormat, compact)
+        astPath = f"{prefix}.ast.{outputFormat}"
+        written = []
+        for path, data in ((astPath, ast), (f"{prefix}.types.json", types)):
+            if self._written.get(path) == data and os.path.exists(path):
+                continue
+            with open(path, "wb") as f:
+                f.write(data)
+            self._written[path] = data
+            written.append(path)
+        if astPath in written:
+            writeAstFingerprint(astPath, fingerprint)
+        return written
+
+
+def watch(
+    converter: IncrementalConverter,
+    prefix: str,
+    outputFormat: str = "json",
+    compact: bool = False,
+    interval: float = 0.5,
+):
+    """
+    Converts the headers, then keeps polling them and rewrites changed outputs until interrupted
+    """
+    while True:
+        reparsed = converter.update()
+        if reparsed:
+            written = converter.writeOutputs(prefix, outputFormat, compact)
+            converter.logger.info(
+                f"Reparsed {', '.join(reparsed)}, wrote {', '.join(written) or 'nothing'}"
+            )
+        time.sleep(interval)
+
+
+class _ConversionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.convert(json.loads(line))
+            except Exception as e:
+                response = {"status": "error", "message": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class ConversionServer(socketserver.UnixStreamServer):
+    """
+    Unix socket server that keeps an IncrementalConverter alive per distinct request
+    """
+
+    def __init__(self, socketPath: str):
+        super().__init__(socketPath, _ConversionHandler)
+        self.converters: Dict[tuple, IncrementalConverter] = {}
+
+    def convert(self, request: dict) -> dict:
+        start = time.perf_counter()
+        # Requests are handled one at a time, so changing directory here is safe
+        os.chdir(request["cwd"])
+        key = (
+            request["cwd"],
+            tuple(request["headers"]),
+            tuple(request.get("ignore_macros", [])),
+            tuple(request.get("deprecation_macros") or ["HELICS_DEPRECATED"]),
+            tuple(request.get("annotation_macros", [])),
+            tuple(
+                tuple(request.get(option, []))
+                for option in (
+                    "include_kinds",
+                    "exclude_kinds",
+                    "include_names",
+                    "exclude_names",
+                    "omit_fields",
+                )
+            ),
+        )
+        converter = self.converters.get(key)
+        if converter is None:
+            cursorFilter = CursorFilter(*key[5])
+            converter = IncrementalConverter(
+                list(key[1]), list(key[2]), list(key[3]), list(key[4]), cursorFilter
+            )
+            self.converters[key] = converter
+        reparsed = converter.update()
+        written = converter.writeOutputs(
+            request["prefix"],
+            request.get("format", "json"),
+            request.get("compact", False),
+        )
+        return {
+            "status": "ok",
+            "reparsed": reparsed,
+            "written": written,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+def serve(socketPath: str):
+    """
+    Serves conversion requests on a Unix socket until interrupted
+    """
+    if os.path.exists(socketPath):
+        os.remove(socketPath)
+    with ConversionServer(socketPath) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socketPath)
+
+
+def requestConversion(socketPath: str, request: dict) -> dict:
+    """
+    Sends a conversion request to a server started with serve()
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socketPath)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
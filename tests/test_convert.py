@@ -0,0 +1,135 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Tests of converting header files, and that every way of parsing them gives the same
+output as a serial run.
+"""
+
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from cheader2json.__main__ import cli
+
+COMMON_HEADER = """
+#ifndef COMMON_H
+#define COMMON_H
+#define HELICS_EXPORT
+#define HELICS_DEPRECATED __attribute__((deprecated))
+#define HELICS_VERSION 3
+typedef void* HelicsFederate;
+typedef enum {
+    HELICS_OK = 0,
+    HELICS_ERROR = -1
+} HelicsErrorTypes;
+typedef struct HelicsError {
+    int error_code;
+    const char* message;
+} HelicsError;
+#endif
+"""
+
+API_HEADER = """
+#include "common.h"
+/** Create a federate */
+HELICS_EXPORT HelicsFederate helicsCreateFed(const char* name, HelicsError* err);
+HELICS_DEPRECATED HELICS_EXPORT void helicsOld(HelicsFederate fed, int count);
+typedef enum { HELICS_A = 3 } HelicsAnon;
+struct HelicsPoint { int x; int y; };
+"""
+
+INFO_HEADER = """
+#include "common.h"
+HELICS_EXPORT int helicsInfo(HelicsFederate fed);
+typedef struct { int flags; } HelicsInfo;
+"""
+
+
+@pytest.fixture(scope="module")
+def headers(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("headers")
+    for name, header in (
+        ("common", COMMON_HEADER),
+        ("api", API_HEADER),
+        ("info", INFO_HEADER),
+    ):
+        (directory / f"{name}.h").write_text(header)
+    return directory
+
+
+def _convert(directory, headers: list, *args: str) -> tuple:
+    prefix = str(directory / "out")
+    result = CliRunner().invoke(
+        cli, ["convert", *map(str, headers), "--prefix", prefix, *args]
+    )
+    assert result.exit_code == 0, result.output
+    return (
+        (directory / "out.ast.json").read_bytes(),
+        (directory / "out.types.json").read_bytes(),
+    )
+
+
+CONVERSIONS = {
+    "all": (["api", "info", "common"], []),
+    "repeated": (["api", "common", "api"], []),
+    "filtered": (
+        ["api", "info", "common"],
+        ["--include-kind", "FUNCTION_DECL", "--exclude-name", "helicsOld"],
+    ),
+    "ignored": (["api", "info", "common"], ["-i", "HELICS_EXPORT"]),
+}
+
+
+@pytest.fixture(scope="module", params=sorted(CONVERSIONS))
+def conversion(request, headers, tmp_path_factory):
+    names, args = CONVERSIONS[request.param]
+    files = [headers / f"{name}.h" for name in names]
+    serial = _convert(tmp_path_factory.mktemp("serial"), files, *args)
+    return files, args, serial
+
+
+def test_jobs(conversion, tmp_path):
+    files, args, serial = conversion
+    assert _convert(tmp_path, files, *args, "--jobs", "2") == serial
+
+
+def test_umbrella(conversion, tmp_path):
+    files, args, serial = conversion
+    assert _convert(tmp_path, files, *args, "--umbrella") == serial
+
+
+def test_preamble(conversion, headers, tmp_path):
+    files, args, serial = conversion
+    preamble = ["--preamble", str(headers / "common.h"), "--pch-dir", str(tmp_path)]
+    assert _convert(tmp_path, files, *args, *preamble) == serial
+    # The second run reuses the precompiled preamble written by the first
+    assert _convert(tmp_path, files, *args, *preamble) == serial
+
+
+def test_anonymous_declarations(tmp_path):
+    # Anonymous declarations on the same lines of different headers are only named
+    # after a typedef in their own header
+    first = tmp_path / "first.h"
+    first.write_text("typedef enum { ONE = 1 } First;\n")
+    second = tmp_path / "second.h"
+    second.write_text(
+        "typedef struct { int a; } Second;\nstruct { int b; } unnamedVariable;\n"
+    )
+    ast, _ = _convert(tmp_path, [first, second])
+    assert [
+        (r["kind"], r["spelling"], os.path.basename(r["location"]))
+        for r in json.loads(ast).values()
+    ] == [
+        ("ENUM_DECL", "First", "first.h"),
+        ("TYPEDEF_DECL", "First", "first.h"),
+        ("STRUCT_DECL", "Second", "second.h"),
+        ("TYPEDEF_DECL", "Second", "second.h"),
+        ("STRUCT_DECL", f"struct (unnamed at {second}:2:1)", "second.h"),
+        ("VAR_DECL", "unnamedVariable", "second.h"),
+    ]
@@ -0,0 +1,214 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Tests of the diff between two converted versions of a header file.
+"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from cheader2json.__main__ import cli
+from cheader2json.ast_index import AstIndex
+from cheader2json.change_search import Change, iterChanges
+
+OLD_HEADER = """
+#define API_VERSION 1
+#define OLD_LIMIT 10
+
+enum Status { STATUS_OK = 0, STATUS_ERROR = 1, STATUS_GONE = 2 };
+enum OldMode { MODE_A };
+
+struct Point {
+    int x;
+    int y;
+};
+struct Gone {
+    int a;
+};
+
+int compute(int value);
+double scale(double factor, int count);
+void removedFunction(void);
+"""
+
+NEW_HEADER = """
+#define API_VERSION 2
+#define NEW_LIMIT 20
+
+enum Status { STATUS_OK = 0, STATUS_ERROR = -1, STATUS_BUSY = 3 };
+enum Color { COLOR_RED };
+
+struct Point {
+    int x;
+    long y;
+    int z;
+};
+struct Added {
+    int b;
+};
+
+long compute(int value);
+double scale(float factor, int count);
+void addedFunction(const char *name, int size);
+"""
+
+
+def _convert(
+    directory, name: str, header: str, *args: str, suffix: str = "ast.json"
+) -> str:
+    headerPath = directory / f"{name}.h"
+    headerPath.write_text(header)
+    prefix = str(directory / name)
+    result = CliRunner().invoke(
+        cli, ["convert", str(headerPath), "--prefix", prefix, *args]
+    )
+    assert result.exit_code == 0, result.output
+    return f"{prefix}.{suffix}"
+
+
+@pytest.fixture(scope="module")
+def asts(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("diff")
+    return (
+        _convert(directory, "old", OLD_HEADER),
+        _convert(directory, "new", NEW_HEADER),
+    )
+
+
+@pytest.fixture(scope="module")
+def changes(asts):
+    old, new = asts
+    return list(iterChanges(AstIndex.load(old), AstIndex.load(new)))
+
+
+def _ofKind(changes, *kinds):
+    return [c for c in changes if c.kind in kinds]
+
+
+def test_functions(changes):
+    assert _ofKind(changes, "FUNCTION_DECL", "PARM_DECL") == [
+        Change(
+            "added", "FUNCTION_DECL", ("addedFunction",), new="Char_S* name, Int size"
+        ),
+        Change("removed", "FUNCTION_DECL", ("removedFunction",)),
+        Change("changed", "FUNCTION_DECL", ("compute",), "result_type", "Int", "Long"),
+        Change("changed", "PARM_DECL", ("scale", "factor"), "type", "Double", "Float"),
+    ]
+
+
+def test_enums(changes):
+    assert _ofKind(changes, "ENUM_DECL", "ENUM_CONSTANT_DECL") == [
+        Change("added", "ENUM_DECL", ("Color",)),
+        Change("removed", "ENUM_DECL", ("OldMode",)),
+        Change("added", "ENUM_CONSTANT_DECL", ("Status", "STATUS_BUSY"), new=3),
+        Change("removed", "ENUM_CONSTANT_DECL", ("Status", "STATUS_GONE")),
+        Change(
+            "changed", "ENUM_CONSTANT_DECL", ("Status", "STATUS_ERROR"), "value", 1, -1
+        ),
+    ]
+
+
+def test_structs(changes):
+    assert _ofKind(changes, "STRUCT_DECL", "FIELD_DECL") == [
+        Change("added", "STRUCT_DECL", ("Added",)),
+        Change("removed", "STRUCT_DECL", ("Gone",)),
+        Change("added", "FIELD_DECL", ("Point", "z")),
+        Change("changed", "FIELD_DECL", ("Point", "y"), "type", "Int", "Long"),
+    ]
+
+
+def test_macros(changes):
+    # Only added and removed macros are listed, not changed values
+    assert _ofKind(changes, "MACRO_DEFINITION") == [
+        Change("added", "MACRO_DEFINITION", ("NEW_LIMIT",)),
+        Change("removed", "MACRO_DEFINITION", ("OLD_LIMIT",)),
+    ]
+
+
+def test_no_changes(asts):
+    old, _ = asts
+    assert list(iterChanges(AstIndex.load(old), AstIndex.load(old))) == []
+
+
+def test_text_format(asts):
+    result = CliRunner().invoke(cli, ["diff", *asts])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        "New function: addedFunction (Char_S* name, Int size)",
+        "Removed function: removedFunction",
+        "Changed return type in compute from Int to Long",
+        "Changed type for param factor in scale from Double to Float",
+        "New enum: Color",
+        "Removed enum: OldMode",
+        "New constant STATUS_BUSY=3 in enum Status",
+        "Removed constant STATUS_GONE from enum Status",
+        "Value of constant STATUS_ERROR in enum Status changed from 1 to -1",
+        "New struct: Added",
+        "Removed struct: Gone",
+        "New field z in struct Point",
+        "Type of field y in struct Point changed from Int to Long",
+        "New macro: NEW_LIMIT",
+        "Removed macro: OLD_LIMIT",
+    ]
+
+
+def test_json_format(asts, changes):
+    result = CliRunner().invoke(cli, ["diff", *asts, "--format=json"])
+    assert result.exit_code == 0
+    # Streamed changes come in the order of the sorted declarations
+    assert sorted(
+        json.dumps(change, sort_keys=True) for change in json.loads(result.output)
+    ) == sorted(json.dumps(c._asdict(), sort_keys=True) for c in changes)
+
+
+def test_json_format_no_changes(asts):
+    old, _ = asts
+    result = CliRunner().invoke(cli, ["diff", old, old, "--format=json"])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == []
+
+
+def test_check(asts):
+    old, new = asts
+    result = CliRunner().invoke(cli, ["diff", old, new, "--check"])
+    assert result.exit_code == 1
+    assert result.output == "New function: addedFunction (Char_S* name, Int size)\n"
+    result = CliRunner().invoke(cli, ["diff", old, old, "--check"])
+    assert result.exit_code == 0
+    assert result.output == ""
+
+
+def test_unnamed_and_same_named_parameters(asts, tmp_path):
+    old, _ = asts
+    new = _convert(tmp_path, "params", "int f_dbl(int, int);\n")
+    added = next(iter(iterChanges(AstIndex.load(old), AstIndex.load(new))))
+    assert added == Change("added", "FUNCTION_DECL", ("f_dbl",), new="Int , Int ")
+    # Parameters are summarized in order, even when they share a name
+    function = dict(AstIndex.load(new).declaration("FUNCTION_DECL", "f_dbl"))
+    function["arguments"] = {
+        key: dict(argument, spelling="same")
+        for key, argument in function["arguments"].items()
+    }
+    changes = iterChanges({}, {"0": function})
+    assert next(changes).new == "Int same, Int same"
+
+
+def test_stream(changes, tmp_path):
+    sortedAsts = [
+        _convert(
+            tmp_path, name, header, "--format=ndjson", "--sort", suffix="ast.ndjson"
+        )
+        for name, header in (("old", OLD_HEADER), ("new", NEW_HEADER))
+    ]
+    result = CliRunner().invoke(cli, ["diff", *sortedAsts, "--stream", "--format=json"])
+    assert result.exit_code == 0, result.output
+    # Streamed changes come in the order of the sorted declarations
+    assert sorted(
+        json.dumps(change, sort_keys=True) for change in json.loads(result.output)
+    ) == sorted(json.dumps(c._asdict(), sort_keys=True) for c in changes)
@@ -0,0 +1,125 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Tests that the other ast file formats load back to the records of a json ast file.
+"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from cheader2json.__main__ import cli
+from cheader2json.ast_index import loadAst
+from cheader2json.ast_writer import sortKey
+from cheader2json.schema_v2 import CHILDREN_FIELDS
+
+HEADER = """
+#define HELICS_DEPRECATED __attribute__((deprecated))
+#define HELICS_VERSION "3.5"
+/** An opaque federate */
+typedef void* HelicsFederate;
+typedef enum { HELICS_OK = 0, HELICS_ERROR = -1 } HelicsErrorTypes;
+typedef struct HelicsError {
+    int error_code;
+    const char* message;
+    struct { int line; } location;
+} HelicsError;
+/** Create a federate */
+HelicsFederate helicsCreateFed(const char* name, HelicsError* err);
+HELICS_DEPRECATED void helicsOld(HelicsFederate fed, char** names, int count);
+static const double helics_time_zero = -1.5;
+"""
+
+
+@pytest.fixture(scope="module")
+def directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("formats")
+    (directory / "api.h").write_text(HEADER)
+    return directory
+
+
+def _convert(directory, name: str, *args: str) -> str:
+    prefix = str(directory / name)
+    result = CliRunner().invoke(
+        cli, ["convert", str(directory / "api.h"), "--prefix", prefix, *args]
+    )
+    assert result.exit_code == 0, result.output
+    return prefix
+
+
+def _load(path: str):
+    with open(path, "rb") as f:
+        return loadAst(f)
+
+
+@pytest.fixture(scope="module")
+def reference(directory):
+    prefix = _convert(directory, "json")
+    with open(f"{prefix}.ast.json") as f:
+        ast = json.load(f)
+    with open(f"{prefix}.types.json") as f:
+        types = json.load(f)
+    return ast, types
+
+
+def test_bin(directory, reference):
+    ast, _ = reference
+    binary = _load(f"{_convert(directory, 'bin', '--format=bin')}.ast.bin")
+    assert dict(binary.items()) == ast
+    # Lazy records give the same fields from the declaration table as from the payload
+    assert {key: dict(record) for key, record in binary.lazyItems()} == ast
+
+
+def test_bin_without_lines(directory):
+    prefix = _convert(directory, "nolines", "--omit-field=lines")
+    with open(f"{prefix}.ast.json") as f:
+        ast = json.load(f)
+    binary = _load(
+        f"{_convert(directory, 'nolines', '--omit-field=lines', '--format=bin')}.ast.bin"
+    )
+    assert {key: dict(record) for key, record in binary.lazyItems()} == ast
+    assert dict(binary.items()) == ast
+
+
+def _fromV2(record: dict, files: list) -> dict:
+    """
+    Turns a version 2 record back into a version 1 record
+    """
+    expanded = {}
+    for field, value in record.items():
+        if field == "location" and isinstance(value, int):
+            value = files[value]
+        elif field in CHILDREN_FIELDS:
+            value = {str(i): _fromV2(child, files) for i, child in enumerate(value)}
+        expanded[field] = value
+    return expanded
+
+
+def test_v2(directory, reference):
+    ast, types = reference
+    prefix = _convert(directory, "v2", "--schema=v2")
+    v2 = _load(f"{prefix}.ast.json")
+    assert {str(key): _fromV2(record, v2.files) for key, record in v2.items()} == ast
+    with open(f"{prefix}.types.json") as f:
+        v2Types = json.load(f)
+    # Functions are stored as their index in the ast file instead of their arguments
+    assert {
+        name: _fromV2(v2[index], v2.files)["arguments"]
+        for name, index in v2Types["functions"].items()
+    } == types["functions"]
+    assert v2Types["types"] == {k: v for k, v in types.items() if k != "functions"}
+
+
+def test_ndjson(directory, reference):
+    ast, _ = reference
+    ndjson = _load(f"{_convert(directory, 'ndjson', '--format=ndjson')}.ast.ndjson")
+    assert ndjson == ast
+    prefix = _convert(directory, "sorted", "--format=ndjson", "--sort")
+    assert list(_load(f"{prefix}.ast.ndjson").values()) == sorted(
+        ast.values(), key=sortKey
+    )
@@ -0,0 +1,73 @@
+"""
+Copyright (c) 2017-2022,
+Battelle Memorial Institute; Lawrence Livermore National Security, LLC; Alliance for
+Sustainable Energy, LLC.  See the top-level NOTICE for additional details.
+All rights reserved.
+SPDX-License-Identifier: BSD-3-Clause
+
+Tests of the on-disk cache of parse results.
+"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from cheader2json.__main__ import cli
+
+COMMON_HEADER = """
+#define HELICS_VALUE int
+"""
+
+API_HEADER = """
+#include "common.h"
+int helicsIsValid(HELICS_VALUE value);
+"""
+
+
+@pytest.fixture
+def headers(tmp_path):
+    (tmp_path / "common.h").write_text(COMMON_HEADER)
+    (tmp_path / "api.h").write_text(API_HEADER)
+    return tmp_path
+
+
+def _convert(directory, *args: str) -> tuple:
+    """
+    Converts api.h and returns the ast and types files, and the headers that were parsed
+    """
+    prefix = str(directory / "out")
+    profile = directory / "profile.json"
+    header = str(directory / "api.h")
+    result = CliRunner().invoke(
+        cli,
+        ["convert", header, "--prefix", prefix, "--profile", str(profile), *args],
+    )
+    assert result.exit_code == 0, result.output
+    parsed = [
+        name
+        for name, stats in json.loads(profile.read_text())["headers"].items()
+        if "parse" in stats["phases"]
+    ]
+    return (
+        (directory / "out.ast.json").read_bytes(),
+        (directory / "out.types.json").read_bytes(),
+        parsed,
+    )
+
+
+def test_hit(headers):
+    cacheDir = str(headers / "cache")
+    ast, types, parsed = _convert(headers, "--cache-dir", cacheDir)
+    assert parsed == [str(headers / "api.h")]
+    assert _convert(headers, "--cache-dir", cacheDir) == (ast, types, [])
+
+
+def test_included_header_changed(headers):
+    cacheDir = str(headers / "cache")
+    before = _convert(headers, "--cache-dir", cacheDir)
+    (headers / "common.h").write_text("#define HELICS_VALUE long\n")
+    ast, types, parsed = _convert(headers, "--cache-dir", cacheDir)
+    assert parsed == [str(headers / "api.h")]
+    assert (ast, types) != before[:2]
+    assert (ast, types) == _convert(headers)[:2]